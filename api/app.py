@@ -1,16 +1,44 @@
-from flask import Flask, redirect, url_for
+from io import BytesIO
+from flask import Flask, Request, current_app, has_app_context, redirect, \
+    url_for
 from config import config
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_marshmallow import Marshmallow
 from apifairy import APIFairy
-from redis import Redis
+from werkzeug.local import LocalProxy
 
-db = SQLAlchemy()
+from api.metrics import Metrics
+from api.replicas import RoutingSession, init_replicas
+from api.storage import create_cache, init_storage
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 mg = Migrate()
 ma = Marshmallow()
 apifairy = APIFairy()
-redis_client = Redis(host=config['default'].REDIS_HOST, port=6379)
+metrics = Metrics()
+default_cache = create_cache(config['default'])
+
+
+def _current_cache():
+    """Returns the cache client of the current app, or the client of the
+    default configuration outside an app context
+    """
+    if has_app_context():
+        return current_app.extensions['cache']
+    return default_cache
+
+
+redis_client = LocalProxy(_current_cache)
+
+
+class InMemoryRequest(Request):
+    """Request that keeps uploaded files in memory instead of temporary
+    files, the upload size is bounded by MAX_CONTENT_LENGTH
+    """
+    def _get_file_stream(self, total_content_length, content_type,
+                         filename=None, content_length=None) -> BytesIO:
+        return BytesIO()
 
 
 def create_app(config_name: str) -> Flask:
@@ -20,15 +48,26 @@ def create_app(config_name: str) -> Flask:
     """
     app: Flask = Flask(__name__)
     app.config.from_object(config[config_name])
+    app.request_class = InMemoryRequest
+    app.extensions['cache'] = create_cache(config[config_name])
 
     # Disable trailing slash
     app.url_map.strict_slashes = False
 
     # Initialize extensions
     db.init_app(app)
+    init_storage(app, db)
+    init_replicas(app, db)
     mg.init_app(app, db)
     ma.init_app(app)
     apifairy.init_app(app)
+    metrics.init_app(app, db)
+
+    from api.snapshot import init_snapshot
+    init_snapshot(app)
+
+    from api.encoding import init_encoding
+    init_encoding(app)
 
     # Register click commands
     from api.cli import bp as cli_bp
@@ -42,6 +81,9 @@ def create_app(config_name: str) -> Flask:
     from api.company import bp as company_bp
     app.register_blueprint(company_bp)
 
+    from api.jobs import bp as jobs_bp
+    app.register_blueprint(jobs_bp)
+
     # Register shell context
     from api import models
 
@@ -1,11 +1,13 @@
+import os
 import click
 from flask import Blueprint
-from sqlalchemy.exc import IntegrityError
-from warnings import warn
+from sqlalchemy.exc import DataError, SQLAlchemyError
 
-from api.app import db
-from api.models import Company
-from data_extractor import FileProcessor
+from api.ingest import enqueue_job, get_job, save_companies, save_company, \
+    work
+from api.snapshot import export_snapshot
+from config import config
+from data_extractor import Checkpoint, DeadLetterQueue, FileProcessor
 
 bp = Blueprint('script', __name__, cli_group=None)
 
@@ -13,30 +15,133 @@ bp = Blueprint('script', __name__, cli_group=None)
 @bp.cli.command('extract',
                 help='Extract data from text files in the ./txt folder.')
 @click.option('--folder', default='./txt',
-              help='Path to the folder containing the txt files')
-def extract(folder: str) -> None:
+              help='Path to the folder or archive containing the txt files')
+@click.option('--resume', is_flag=True,
+              help='Skip the files recorded in the checkpoint file.')
+@click.option('--checkpoint', default='./extract.checkpoint',
+              help='Path to the file recording the processed files')
+@click.option('--dead-letter', default='./extract.deadletter.jsonl',
+              help='Path to the file collecting the failed files')
+@click.option('--batch-size', default=100, show_default=True,
+              help='Number of companies inserted per transaction')
+@click.option('--snapshot', default=None,
+              help='Also write a snapshot of all companies to this path')
+def extract(folder: str, resume: bool, checkpoint: str,
+            dead_letter: str, batch_size: int, snapshot: str | None) -> None:
     """Extract data from text files in the ./txt folder and insert them to the
     database.
     :param folder: Path to the folder containing the txt files.
+    :param resume: Skip the files recorded in the checkpoint file.
+    :param checkpoint: Path to the file recording the processed files.
+    :param dead_letter: Path to the file collecting the failed files.
+    :param batch_size: Number of companies inserted per transaction.
+    :param snapshot: Also write a snapshot of all companies to this path.
     """
-    fp = FileProcessor(folder=folder)
-    company_data = fp.process_files()
+    progress = Checkpoint(checkpoint)
+    if not resume:
+        progress.reset()
+    failures = DeadLetterQueue(dead_letter)
+    fp = FileProcessor(folder=folder, checkpoint=progress,
+                       dead_letter=failures)
 
     added_companies = 0
-    for data in company_data:
-        company = Company(name=data['name'],
-                          gemh=data['gemh'],
-                          website=data['website'],
-                          registration_date=data['date'])
-        db.session.add(company)
-        try:
-            db.session.commit()
-            added_companies += 1
-        except IntegrityError as e:
-            db.session.rollback()
-            print(f'Duplicate entry for {data["name"]}')
-            warn(e)
-    print(f'Successfully added {added_companies} companies to the database.')
+    duplicate_companies = 0
+    batch = []
+
+    def flush() -> None:
+        """Inserts the batch in one transaction, or one company at a time
+        if a company is rejected, and records the files in the checkpoint.
+        Database failures propagate before the files are recorded, so
+        --resume retries the batch
+        """
+        nonlocal added_companies, duplicate_companies
+        if save_companies([data for _, data in batch]):
+            added_companies += len(batch)
+        else:
+            for filename, data in batch:
+                try:
+                    if save_company(data):
+                        added_companies += 1
+                    else:
+                        duplicate_companies += 1
+                except DataError as e:
+                    failures.put(filename, e)
+        for filename, _ in batch:
+            progress.mark(filename)
+        batch.clear()
+
+    try:
+        for filename, data in fp.iter_files():
+            batch.append((filename, data))
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    except SQLAlchemyError as e:
+        raise click.ClickException(
+            f'Database error, the remaining files are retried with '
+            f'--resume: {e.__cause__ or e}')
+    finally:
+        progress.close()
+
+    fp.print_report()
+    print(f'Successfully added {added_companies} companies to the database, '
+          f'skipped {duplicate_companies} duplicate entries.')
+    if failures.count:
+        print(f'{failures.count} files failed, see {dead_letter}')
+    if snapshot:
+        count = export_snapshot(snapshot)
+        print(f'Wrote {count} companies to the snapshot {snapshot}.')
+
+
+@bp.cli.command('snapshot', help='Write a snapshot of all companies.')
+@click.argument('path', default=config['default'].SNAPSHOT_PATH or
+                './companies.snapshot')
+def snapshot(path: str) -> None:
+    """Write a snapshot of all companies that the API workers memory-map.
+    :param path: Path of the snapshot.
+    """
+    count = export_snapshot(path)
+    print(f'Wrote {count} companies to the snapshot {path}.')
+
+
+@bp.cli.command('enqueue',
+                help='Queue a folder of txt files for the ingest workers.')
+@click.option('--folder', default='./txt',
+              help='Path to the folder or archive containing the txt files')
+def enqueue(folder: str) -> None:
+    """Queue a folder of txt files for the ingest workers.
+    :param folder: Path to the folder containing the txt files.
+    """
+    job_id = enqueue_job(folder=os.path.abspath(folder))
+    print(f'Queued job {job_id} for {folder}.')
+
+
+@bp.cli.command('worker', help='Run an ingest worker.')
+@click.option('--burst', is_flag=True,
+              help='Stop once the job queue is empty.')
+def worker(burst: bool) -> None:
+    """Run an ingest worker that consumes queued extraction jobs.
+    :param burst: Stop once the job queue is empty.
+    """
+    jobs = work(burst=burst)
+    print(f'Worker finished {jobs} jobs.')
+
+
+@bp.cli.command('job', help='Show the status of an ingest job.')
+@click.argument('job_id')
+def job(job_id: str) -> None:
+    """Show the status of an ingest job.
+    :param job_id: The id of the job.
+    """
+    status = get_job(job_id)
+    if status is None:
+        print(f'Job {job_id} not found.')
+        return
+    print(f'{status["status"]}: {status["processed"]}/{status["total"]} '
+          f'processed, {status["added"]} added, '
+          f'{status["duplicates"]} duplicates, {status["failed"]} failed, '
+          f'{status["throughput"]:.1f} files/sec')
 
 
 @bp.cli.command('test', help='Run tests.')
@@ -1,23 +1,47 @@
-from flask import Blueprint, abort
-from apifairy import response, other_responses
+import json
+from collections.abc import Iterator
+from flask import Blueprint, abort, current_app, request
+from apifairy import arguments, response, other_responses
+from sqlalchemy.exc import SQLAlchemyError
 
 from api.app import db
-from api.models import Company
-from api.schemas import CompanySchema
+from api.ingest import upsert_company
+from api.models import Company, normalize_domain, normalize_name
+from api.schemas import CompanyFilterSchema, CompanySchema, \
+    ExtractArgsSchema, ExtractionSchema
 from api.pagination import paginated_response
+from api.snapshot import Snapshot
+from data_extractor import DataExtractor
 
 bp = Blueprint('company', __name__)
 
 company_schema = CompanySchema()
 companies_schema = CompanySchema(many=True)
+extractions_schema = ExtractionSchema(many=True)
+extractor = DataExtractor()
+
+NDJSON_MIMETYPES: tuple[str, ...] = ('application/x-ndjson',
+                                     'application/ndjson',
+                                     'application/jsonl')
 
 
 @bp.route('/company')
+@arguments(CompanyFilterSchema)
 @paginated_response(companies_schema)
-def get_companies():
+def get_companies(filters: dict):
     """Get Companies
+    Websites and names are matched after normalization, so
+    `https://www.example.com/` and `example.com` find the same company.
     """
-    return Company.query
+    query = Company.query
+    if 'gemh' in filters:
+        query = query.filter_by(gemh=filters['gemh'])
+    if 'website' in filters:
+        query = query.filter_by(domain=normalize_domain(filters['website']))
+    if 'name' in filters:
+        query = query.filter_by(
+            normalized_name=normalize_name(filters['name']))
+    return query
 
 
 @bp.route('/company/<int:id>')
@@ -26,4 +50,138 @@ def get_companies():
 def get_company(id: int):
     """Get Company
     """
-    return db.session.get(Company, id) or abort(404)
+    snapshot = _snapshot()
+    company = snapshot.get_by_id(id) if snapshot is not None else None
+    # Companies stored since the snapshot was written are only in the
+    # database
+    return company or db.session.get(Company, id) or abort(404)
+
+
+@bp.route('/company/gemh/<int:gemh>')
+@response(company_schema)
+@other_responses({404: 'Company not found'})
+def get_company_by_gemh(gemh: int):
+    """Get Company by GEMH
+    """
+    snapshot = _snapshot()
+    company = snapshot.get_by_gemh(gemh) if snapshot is not None else None
+    return company or Company.query.filter_by(gemh=gemh).first() \
+        or abort(404)
+
+
+@bp.route('/company/extract', methods=['POST'])
+@arguments(ExtractArgsSchema)
+@response(extractions_schema)
+@other_responses({400: 'Invalid document',
+                  413: 'Too many or too large documents',
+                  415: 'Unsupported media type'})
+def extract_companies(args: dict):
+    """Extract Companies
+    Extract companies from announcement texts sent either as multipart
+    `documents` files or as NDJSON lines of `{"name": ..., "text": ...}`
+    objects, and store them when `save` is set.
+    """
+    extractions = []
+    for index, (name, text) in enumerate(_iter_documents()):
+        if index >= current_app.config['EXTRACT_MAX_DOCUMENTS']:
+            abort(413, 'Too many documents.')
+        extractions.append(_extract_document(name, text))
+
+    # Nothing is stored until the whole body has been accepted
+    if args['save']:
+        for extraction, data in extractions:
+            if data is not None:
+                _save_extraction(extraction, data)
+    return [extraction for extraction, _ in extractions]
+
+
+def _snapshot() -> Snapshot | None:
+    """Gets the current company snapshot
+    :return: The snapshot or None if snapshots are disabled or missing
+    """
+    store = current_app.extensions.get('snapshot')
+    return store.get() if store is not None else None
+
+
+def _iter_documents() -> Iterator[tuple[str, str]]:
+    """Iterates the documents of the request body
+    :return: An iterator of document names and texts
+    """
+    if request.mimetype in NDJSON_MIMETYPES:
+        yield from _iter_ndjson_documents()
+    elif request.mimetype == 'multipart/form-data':
+        for document in request.files.getlist('documents'):
+            try:
+                yield document.filename, document.read().decode('utf-8')
+            except UnicodeDecodeError:
+                abort(400, f'{document.filename} is not UTF-8 text.')
+    else:
+        abort(415)
+
+
+def _iter_ndjson_documents() -> Iterator[tuple[str, str]]:
+    """Parses an NDJSON request body line by line without buffering it
+    :return: An iterator of document names and texts
+    """
+    max_length = current_app.config['MAX_CONTENT_LENGTH']
+    if request.content_length is not None \
+            and request.content_length > max_length:
+        abort(413)
+
+    read = 0
+    for number, line in enumerate(request.stream, start=1):
+        read += len(line)
+        if read > max_length:
+            abort(413)
+        if not line.strip():
+            continue
+
+        try:
+            document = json.loads(line)
+        except ValueError:
+            abort(400, f'Line {number} is not valid JSON.')
+        if isinstance(document, str):
+            document = {'text': document}
+        if not isinstance(document, dict) \
+                or not isinstance(document.get('text'), str):
+            abort(400, f'Line {number} has no text.')
+        yield str(document.get('name', number)), document['text']
+
+
+def _extract_document(name: str,
+                      text: str) -> tuple[dict[str, any], dict | None]:
+    """Extracts the company of a document
+    :param name: The name of the document
+    :param text: The text of the document
+    :return: The extraction result and the extracted data, or None instead
+        of the data if the extraction failed
+    """
+    try:
+        results = extractor.extract_results(text)
+    except ValueError as e:
+        return {'document': name, 'error': str(e)}, None
+
+    data = {field: result.value for field, result in results.items()}
+    extraction = {
+        'document': name,
+        'name': data['name'] or None,
+        'gemh': data['gemh'] or None,
+        'website': data['website'] or None,
+        'registration_date': data['date'] or None,
+        'confidence': {field: result.confidence
+                       for field, result in results.items()},
+    }
+    return extraction, data
+
+
+def _save_extraction(extraction: dict[str, any],
+                     data: dict[str, any]) -> None:
+    """Inserts or updates the company of an extraction and records its id,
+    or the error if it could not be stored
+    :param extraction: The extraction result
+    :param data: The extracted data
+    """
+    try:
+        extraction['id'] = upsert_company(data).id
+    except SQLAlchemyError as e:
+        extraction['error'] = str(e.__cause__ or e)
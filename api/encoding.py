@@ -0,0 +1,195 @@
+import gzip
+import pickle
+import time
+import brotli
+import msgpack
+import orjson
+from flask import Flask, Response, current_app, g, has_request_context, \
+    request
+from flask.json.provider import DefaultJSONProvider
+
+from api.app import metrics, redis_client
+
+JSON_MIMETYPE: str = 'application/json'
+MSGPACK_MIMETYPES: tuple[str, ...] = ('application/msgpack',
+                                      'application/x-msgpack')
+COMPRESSIBLE_MIMETYPES: tuple[str, ...] = (JSON_MIMETYPE, *MSGPACK_MIMETYPES,
+                                           'text/plain')
+# Preferred first when the client accepts both with the same quality
+ENCODINGS: tuple[str, ...] = ('br', 'gzip')
+
+
+class JSONProvider(DefaultJSONProvider):
+    """Encodes responses as JSON, or as msgpack when the client prefers it
+    in its Accept header
+
+    JSON is encoded with orjson when JSON_ENCODER is 'orjson' and with the
+    standard library otherwise. Both produce the same documents: keys keep
+    their order, non-ASCII characters are not escaped and dates go through
+    the default Flask conversions.
+    """
+    ensure_ascii: bool = False
+    sort_keys: bool = False
+
+    def __init__(self, app: Flask):
+        super().__init__(app)
+        self.use_orjson = app.config['JSON_ENCODER'] == 'orjson'
+
+    def dumps(self, obj: any, **kwargs) -> str:
+        if not self.use_orjson or 'cls' in kwargs:
+            return super().dumps(obj, **kwargs)
+
+        option = orjson.OPT_PASSTHROUGH_DATETIME | \
+            orjson.OPT_PASSTHROUGH_DATACLASS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(obj, default=kwargs.get('default', self.default),
+                            option=option).decode()
+
+    def loads(self, s: str | bytes, **kwargs) -> any:
+        if not self.use_orjson or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs) -> Response:
+        mimetype = response_mimetype()
+        if mimetype == JSON_MIMETYPE:
+            rv = super().response(*args, **kwargs)
+        else:
+            rv = self._app.response_class(
+                msgpack.packb(self._prepare_response_obj(args, kwargs),
+                              default=self.default),
+                mimetype=mimetype)
+        if has_request_context():
+            rv.vary.add('Accept')
+        return rv
+
+
+def response_mimetype() -> str:
+    """Negotiates the format of the response from the Accept header
+    :return: The JSON mimetype, or a msgpack mimetype if the client prefers
+        msgpack
+    """
+    if not has_request_context():
+        return JSON_MIMETYPE
+    return request.accept_mimetypes.best_match(
+        (JSON_MIMETYPE, *MSGPACK_MIMETYPES), JSON_MIMETYPE)
+
+
+def response_encoding() -> str:
+    """Negotiates the compression of the response from the Accept-Encoding
+    header
+    :return: 'br', 'gzip' or 'identity'
+    """
+    return request.accept_encodings.best_match(ENCODINGS, 'identity')
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    """Compresses a response body
+    :param body: The body
+    :param encoding: 'br' or 'gzip'
+    :return: The compressed body
+    """
+    if encoding == 'br':
+        return brotli.compress(
+            body, quality=current_app.config['COMPRESS_BROTLI_QUALITY'])
+    # A fixed mtime keeps the output identical for identical bodies
+    return gzip.compress(body,
+                         compresslevel=current_app.config['COMPRESS_LEVEL'],
+                         mtime=0)
+
+
+def get_encoded(key: str) -> Response | None:
+    """Gets the encoded response cached for a cache entry in the format and
+    compression negotiated for the current request
+    :param key: The key of the cache entry
+    :return: The response or None if it is not cached or the entry it was
+        encoded from is due for a refresh
+    """
+    encoded = redis_client.hget(f'{key}:encoded', _variant())
+    if encoded is None:
+        return None
+
+    refresh_at, mimetype, encoding, body = pickle.loads(encoded)
+    if time.time() >= refresh_at:
+        return None
+
+    metrics.record_cache('hit')
+    response = current_app.response_class(body, mimetype=mimetype)
+    response.vary.add('Accept')
+    if encoding != 'identity':
+        response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def set_encoded(key: str, refresh_at: float, response: Response) -> None:
+    """Caches an encoded response next to the cache entry it was encoded
+    from, until the entry is due for a refresh
+    :param key: The key of the cache entry
+    :param refresh_at: The refresh time of the cache entry
+    :param response: The encoded response
+    """
+    ttl = int(refresh_at - time.time())
+    if ttl <= 0:
+        return
+    encoded_key = f'{key}:encoded'
+    pipeline = redis_client.pipeline()
+    pipeline.hset(encoded_key, _variant(), pickle.dumps((
+        refresh_at, response.mimetype,
+        response.headers.get('Content-Encoding', 'identity'),
+        response.get_data())))
+    pipeline.expire(encoded_key, ttl)
+    pipeline.execute()
+
+
+def _variant() -> str:
+    """Gets the name of the representation negotiated for the request
+    :return: The mimetype and the encoding
+    """
+    return f'{response_mimetype()};{response_encoding()}'
+
+
+def _compressible(response: Response) -> bool:
+    """Checks if a response can be compressed
+    :param response: The response
+    :return: True for complete JSON, msgpack and text responses that are not
+        encoded yet
+    """
+    return not response.direct_passthrough and not response.is_streamed \
+        and response.status_code not in (204, 304) \
+        and 'Content-Encoding' not in response.headers \
+        and response.mimetype in COMPRESSIBLE_MIMETYPES
+
+
+def _after_request(response: Response) -> Response:
+    if response.mimetype in COMPRESSIBLE_MIMETYPES:
+        # Also responses served encoded from the cache, they were chosen by
+        # the Accept-Encoding header as well
+        response.vary.add('Accept-Encoding')
+    if not _compressible(response):
+        return response
+
+    encoding = response_encoding()
+    if encoding != 'identity' and response.content_length is not None \
+            and response.content_length >= \
+            current_app.config['COMPRESS_MIN_SIZE']:
+        response.set_data(compress(response.get_data(), encoding))
+        response.headers['Content-Encoding'] = encoding
+
+    key, refresh_at = g.get('cache_key'), g.get('cache_refresh_at')
+    if key is not None and refresh_at is not None \
+            and response.status_code == 200:
+        set_encoded(key, refresh_at, response)
+    return response
+
+
+def init_encoding(app: Flask) -> None:
+    """Installs the JSON provider and compresses responses larger than
+    COMPRESS_MIN_SIZE bytes
+    :param app: The Flask application
+    """
+    app.json_provider_class = JSONProvider
+    app.json = JSONProvider(app)
+    app.after_request(_after_request)
@@ -0,0 +1,307 @@
+import time
+import uuid
+import zipfile
+from flask import current_app
+from functools import partial
+from sqlalchemy.exc import DataError, IntegrityError, SQLAlchemyError
+
+from api.app import db, redis_client
+from api.models import Company
+from api.snapshot import record_change
+from data_extractor import DeadLetterQueue, FileProcessor
+
+JobDict = dict[str, any]
+
+JOB_PROCESSING_QUEUE: str = '{}:processing'
+JOB_KEY: str = 'ingest:job:{}'
+JOB_DOCUMENTS_KEY: str = 'ingest:job:{}:documents'
+JOB_ERRORS_KEY: str = 'ingest:job:{}:errors'
+JOB_INT_FIELDS: tuple[str, ...] = ('total', 'processed', 'added',
+                                   'duplicates', 'failed')
+JOB_FLOAT_FIELDS: tuple[str, ...] = ('created', 'started', 'finished')
+
+
+class RedisDeadLetterQueue(DeadLetterQueue):
+    """Collects the documents of a job that failed to be processed in Redis
+    """
+    def __init__(self, job_id: str):
+        super().__init__(JOB_ERRORS_KEY.format(job_id))
+        self.job_id = job_id
+
+    def put(self, name: str, error: Exception) -> None:
+        """Records a failed document
+        :param name: The name of the document
+        :param error: The error that was raised
+        """
+        self.count += 1
+        pipe = redis_client.pipeline()
+        pipe.rpush(self.path, f'{name}: {error!r}')
+        pipe.hincrby(JOB_KEY.format(self.job_id), 'failed', 1)
+        pipe.hincrby(JOB_KEY.format(self.job_id), 'processed', 1)
+        pipe.hset(JOB_KEY.format(self.job_id), 'heartbeat', time.time())
+        pipe.execute()
+
+
+def _company(data: dict[str, any]) -> Company:
+    """Creates a company from extracted data, missing values are stored as
+    NULL so they do not collide in the unique indexes
+    :param data: The extracted data
+    :return: The company
+    """
+    return Company(name=data['name'] or None,
+                   gemh=data['gemh'] or None,
+                   website=data['website'] or None,
+                   registration_date=data['date'] or None)
+
+
+def save_company(data: dict[str, any]) -> bool:
+    """Inserts an extracted company to the database
+    :param data: The extracted data
+    :return: True if the company was added, False if it already exists
+    :raise DataError: If the database rejects a value of the company
+    :raise SQLAlchemyError: If the database failed, e.g. lost its connection
+    """
+    db.session.add(_company(data))
+    try:
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    except SQLAlchemyError:
+        db.session.rollback()
+        raise
+
+
+def save_companies(batch: list[dict[str, any]]) -> bool:
+    """Inserts many extracted companies in a single transaction
+    :param batch: The extracted data
+    :return: True if every company was added, False if a company of the
+        batch was rejected and nothing was stored
+    :raise SQLAlchemyError: If the database failed, e.g. lost its connection
+    """
+    db.session.add_all([_company(data) for data in batch])
+    try:
+        db.session.commit()
+        return True
+    except (IntegrityError, DataError):
+        db.session.rollback()
+        return False
+    except SQLAlchemyError:
+        db.session.rollback()
+        raise
+
+
+def upsert_company(data: dict[str, any]) -> Company:
+    """Inserts an extracted company or updates the company with the same
+    GEMH number
+    :param data: The extracted data
+    :return: The stored company
+    """
+    company = None
+    if data['gemh']:
+        company = Company.query.filter_by(gemh=data['gemh']).first()
+    # New companies are not in any snapshot, only updates make one stale
+    updated = company is not None
+    if company is None:
+        company = Company()
+        db.session.add(company)
+
+    company.name = data['name'] or company.name
+    company.gemh = data['gemh'] or company.gemh
+    company.website = data['website'] or company.website
+    company.registration_date = data['date'] or company.registration_date
+    try:
+        db.session.commit()
+    except SQLAlchemyError:
+        db.session.rollback()
+        raise
+    if updated:
+        record_change(company.id, company.gemh)
+    return company
+
+
+def enqueue_job(folder: str | None = None,
+                documents: dict[str, str] | None = None) -> str:
+    """Queues a folder or uploaded documents for extraction
+    :param folder: Path to a folder containing txt files
+    :param documents: The uploaded documents by name
+    :return: The id of the job
+    """
+    job_id = uuid.uuid4().hex
+    job = {
+        'id': job_id,
+        'status': 'queued',
+        'kind': 'folder' if folder is not None else 'upload',
+        'source': folder if folder is not None else 'upload',
+        'created': time.time(),
+    }
+    # Jobs are judged by their heartbeat from the moment a worker moves them
+    # to its processing list, before it gets to update it
+    job['heartbeat'] = job['created']
+    for field in JOB_INT_FIELDS:
+        job[field] = 0
+    if documents:
+        job['total'] = len(documents)
+
+    pipe = redis_client.pipeline()
+    pipe.hset(JOB_KEY.format(job_id), mapping=job)
+    if documents:
+        pipe.hset(JOB_DOCUMENTS_KEY.format(job_id), mapping=documents)
+    pipe.lpush(current_app.config['INGEST_QUEUE'], job_id)
+    pipe.execute()
+    return job_id
+
+
+def get_job(job_id: str) -> JobDict | None:
+    """Gets the status of a job
+    :param job_id: The id of the job
+    :return: The job or None if it does not exist
+    """
+    raw = redis_client.hgetall(JOB_KEY.format(job_id))
+    if not raw:
+        return None
+
+    job = {key.decode(): value.decode() for key, value in raw.items()}
+    for field in JOB_INT_FIELDS:
+        job[field] = int(job.get(field, 0))
+    for field in JOB_FLOAT_FIELDS:
+        job[field] = float(job[field]) if field in job else None
+
+    job['throughput'] = 0.0
+    if job['started'] is not None:
+        elapsed = (job['finished'] or time.time()) - job['started']
+        if elapsed > 0:
+            job['throughput'] = job['processed'] / elapsed
+    job['errors'] = [error.decode() for error in
+                     redis_client.lrange(JOB_ERRORS_KEY.format(job_id), 0, -1)]
+    return job
+
+
+def run_job(job_id: str) -> None:
+    """Extracts and stores the documents of a job while reporting progress
+    :param job_id: The id of the job
+    """
+    key = JOB_KEY.format(job_id)
+    kind, source = redis_client.hmget(key, 'kind', 'source')
+    if kind is None:
+        return
+
+    fp = FileProcessor(folder=source.decode(),
+                       dead_letter=RedisDeadLetterQueue(job_id))
+    if kind == b'upload':
+        documents = {
+            name.decode(): text.decode() for name, text in
+            redis_client.hgetall(JOB_DOCUMENTS_KEY.format(job_id)).items()}
+        files = fp.iter_documents(
+            (name, partial(documents.get, name)) for name in sorted(documents))
+    else:
+        files = fp.iter_files()
+    # Counting the members of a tar archive decompresses all of it, so its
+    # total is only known once the job is finished
+    streamed = kind != b'upload' and fp.is_archive \
+        and not zipfile.is_zipfile(fp.folder)
+
+    now = time.time()
+    redis_client.hset(key, mapping={'status': 'running', 'started': now,
+                                    'heartbeat': now})
+    if kind != b'upload' and not streamed:
+        try:
+            redis_client.hset(key, 'total', len(fp.list_files()))
+        except OSError as e:
+            redis_client.hset(key, mapping={'status': 'failed',
+                                            'error': repr(e),
+                                            'finished': time.time()})
+            return
+
+    try:
+        for filename, data in files:
+            try:
+                field = 'added' if save_company(data) else 'duplicates'
+            except DataError as e:
+                # Only errors of the document are dead-lettered, the job
+                # fails on database errors instead
+                fp.dead_letter.put(filename, e)
+                continue
+            pipe = redis_client.pipeline()
+            pipe.hincrby(key, field, 1)
+            pipe.hincrby(key, 'processed', 1)
+            pipe.hset(key, 'heartbeat', time.time())
+            pipe.execute()
+    except Exception as e:
+        redis_client.hset(key, mapping={'status': 'failed',
+                                        'error': repr(e),
+                                        'finished': time.time()})
+        return
+
+    redis_client.delete(JOB_DOCUMENTS_KEY.format(job_id))
+    finished = {'status': 'finished', 'finished': time.time()}
+    if streamed:
+        finished['total'] = int(redis_client.hget(key, 'processed') or 0)
+    redis_client.hset(key, mapping=finished)
+
+
+def recover_jobs() -> int:
+    """Recovers the jobs of workers that stopped without finishing them,
+    jobs that were not claimed by a worker are queued again and the others
+    are marked as failed since some of their documents may be stored already
+    :return: The number of recovered jobs
+    """
+    queue = current_app.config['INGEST_QUEUE']
+    processing = JOB_PROCESSING_QUEUE.format(queue)
+    stale = time.time() - current_app.config['INGEST_JOB_TIMEOUT']
+    recovered = 0
+    for job_id in redis_client.lrange(processing, 0, -1):
+        key = JOB_KEY.format(job_id.decode())
+        status, heartbeat, created, claimed = redis_client.hmget(
+            key, 'status', 'heartbeat', 'created', 'claimed')
+        # Claiming a job counts as a heartbeat, and jobs queued before
+        # heartbeats were written at enqueue time fall back to their creation
+        beats = [float(value) for value in (heartbeat or created, claimed)
+                 if value is not None]
+        if beats and max(beats) > stale:
+            continue
+        # Another worker may be recovering the same job
+        if not redis_client.lrem(processing, 1, job_id):
+            continue
+        if status == b'queued' and claimed is None:
+            # A worker that claims it meanwhile runs it, the requeued copy
+            # is skipped since the job can only be claimed once
+            redis_client.rpush(queue, job_id)
+        elif status is not None:
+            redis_client.hset(key, mapping={
+                'status': 'failed',
+                'error': 'The worker stopped while running the job.',
+                'finished': time.time()})
+        recovered += 1
+    return recovered
+
+
+def work(burst: bool = False, timeout: int = 5) -> int:
+    """Consumes jobs from the queue, every job stays in a processing list
+    until it is finished so the jobs of a worker that crashed are recovered
+    by the next one
+    :param burst: Stop once the queue is empty
+    :param timeout: Seconds to wait for a job before polling again
+    :return: The number of jobs that were run
+    """
+    queue = current_app.config['INGEST_QUEUE']
+    processing = JOB_PROCESSING_QUEUE.format(queue)
+    recover_jobs()
+    jobs = 0
+    while True:
+        job_id = redis_client.brpoplpush(queue, processing, timeout=timeout)
+        if job_id is None:
+            if burst:
+                return jobs
+            recover_jobs()
+            continue
+        try:
+            # The job is queued again when its heartbeat looked stale to
+            # recover_jobs, only the worker that claims it first runs it
+            if redis_client.hsetnx(JOB_KEY.format(job_id.decode()),
+                                   'claimed', time.time()):
+                run_job(job_id.decode())
+                jobs += 1
+        finally:
+            redis_client.lrem(processing, 1, job_id)
@@ -0,0 +1,56 @@
+import os
+from flask import Blueprint, abort, current_app
+from apifairy import body, response, other_responses
+
+from api.ingest import enqueue_job, get_job
+from api.schemas import FolderJobSchema, JobSchema, UploadJobSchema
+
+bp = Blueprint('jobs', __name__)
+
+job_schema = JobSchema()
+
+
+@bp.route('/jobs', methods=['POST'])
+@body(FolderJobSchema)
+@response(job_schema, 202)
+@other_responses({400: 'Folder is outside of the ingest root'})
+def create_folder_job(args: dict):
+    """Queue a Folder
+    Queue a folder of txt files on the server for extraction.
+    """
+    root = os.path.realpath(current_app.config['INGEST_ROOT'])
+    folder = os.path.realpath(os.path.join(root, args['folder']))
+    if os.path.commonpath([root, folder]) != root:
+        abort(400, 'Folder is outside of the ingest root.')
+    return get_job(enqueue_job(folder=folder))
+
+
+@bp.route('/jobs/upload', methods=['POST'])
+@body(UploadJobSchema, location='form')
+@response(job_schema, 202)
+@other_responses({400: 'Document is not UTF-8 text'})
+def create_upload_job(args: dict):
+    """Queue Documents
+    Queue uploaded announcement documents for extraction.
+    """
+    documents = {}
+    for index, document in enumerate(args['documents']):
+        try:
+            text = document.read().decode('utf-8')
+        except UnicodeDecodeError:
+            abort(400, f'{document.filename} is not UTF-8 text.')
+        name = document.filename or f'document-{index}'
+        if name in documents:
+            name = f'{index}-{name}'
+        documents[name] = text
+    return get_job(enqueue_job(documents=documents))
+
+
+@bp.route('/jobs/<id>')
+@response(job_schema)
+@other_responses({404: 'Job not found'})
+def get_job_status(id: str):
+    """Get Job
+    Get the progress and throughput of an extraction job.
+    """
+    return get_job(id) or abort(404)
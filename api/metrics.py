@@ -0,0 +1,268 @@
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from threading import Lock
+from flask import Flask, Response, current_app, g, has_app_context, \
+    has_request_context, request
+from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+LabelsTuple = tuple[tuple[str, str], ...]
+
+DEFAULT_BUCKETS: tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1,
+                                      0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS: tuple[float, ...] = (0, 1, 2, 5, 10, 25, 50, 100)
+
+
+def _format_labels(labels: LabelsTuple) -> str:
+    """Formats labels in the Prometheus text format
+    :param labels: The label names and values
+    :return: The formatted labels
+    """
+    if not labels:
+        return ''
+    values = ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\')
+                         .replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in labels)
+    return '{' + values + '}'
+
+
+class Counter:
+    """A counter that only goes up
+
+    Args:
+        name (str): The name of the metric
+        description (str): The help text of the metric
+    """
+    type: str = 'counter'
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values = defaultdict(float)
+        self._lock = Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """Increments the counter
+        :param amount: The amount to add
+        :param labels: The labels of the sample
+        """
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] += amount
+
+    def get(self, **labels) -> float:
+        """Gets the value of the counter
+        :param labels: The labels of the sample
+        :return: The value
+        """
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def samples(self) -> list[str]:
+        """Renders the samples of the metric
+        :return: The sample lines
+        """
+        with self._lock:
+            return [f'{self.name}{_format_labels(labels)} {value}'
+                    for labels, value in self._values.items()]
+
+
+class Histogram:
+    """A histogram of observed values in cumulative buckets
+
+    Args:
+        name (str): The name of the metric
+        description (str): The help text of the metric
+        buckets (tuple[float]): The upper bounds of the buckets
+    """
+    type: str = 'histogram'
+
+    def __init__(self, name: str, description: str,
+                 buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._counts = {}
+        self._sums = defaultdict(float)
+        self._lock = Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        """Observes a value
+        :param value: The observed value
+        :param labels: The labels of the sample
+        """
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts = self._counts.setdefault(
+                key, [0] * (len(self.buckets) + 1))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._sums[key] += value
+
+    def samples(self) -> list[str]:
+        """Renders the samples of the metric
+        :return: The sample lines
+        """
+        lines = []
+        with self._lock:
+            for labels, counts in self._counts.items():
+                total = 0
+                for bound, count in zip(self.buckets + (float('inf'),),
+                                        counts):
+                    total += count
+                    le = '+Inf' if bound == float('inf') else repr(bound)
+                    lines.append(f'{self.name}_bucket'
+                                 f'{_format_labels(labels + (("le", le),))}'
+                                 f' {total}')
+                lines.append(f'{self.name}_count{_format_labels(labels)} '
+                             f'{total}')
+                lines.append(f'{self.name}_sum{_format_labels(labels)} '
+                             f'{self._sums[labels]}')
+        return lines
+
+
+class Gauge:
+    """A value computed when the metrics are collected
+
+    Args:
+        name (str): The name of the metric
+        description (str): The help text of the metric
+        collect (Callable): Returns the samples as label dicts and values
+    """
+    type: str = 'gauge'
+
+    def __init__(self, name: str, description: str, collect):
+        self.name = name
+        self.description = description
+        self.collect = collect
+
+    def samples(self) -> list[str]:
+        """Renders the samples of the metric
+        :return: The sample lines
+        """
+        return [f'{self.name}{_format_labels(tuple(sorted(labels.items())))}'
+                f' {value}' for labels, value in self.collect()]
+
+
+class Metrics:
+    """Collects request, database and cache metrics and exposes them in the
+    Prometheus text format on /metrics
+
+    Metrics are kept per process, so every gunicorn worker reports its own
+    samples and Prometheus should scrape each worker or sum them.
+    """
+    def __init__(self):
+        self.db = None
+        self.requests = Counter('http_requests_total',
+                                'Total HTTP requests.')
+        self.request_latency = Histogram('http_request_duration_seconds',
+                                         'HTTP request latency.')
+        self.request_queries = Histogram('http_request_db_queries',
+                                         'SQL queries per HTTP request.',
+                                         COUNT_BUCKETS)
+        self.queries = Counter('db_queries_total', 'Total SQL queries.')
+        self.query_latency = Histogram('db_query_duration_seconds',
+                                       'SQL query latency.')
+        self.slow_queries = Counter('db_slow_queries_total',
+                                    'SQL queries slower than the threshold.')
+        self.cache = Counter('cache_requests_total',
+                             'Cache lookups by result.')
+        self.metrics = [
+            self.requests, self.request_latency, self.request_queries,
+            self.queries, self.query_latency, self.slow_queries, self.cache,
+            Gauge('cache_hit_ratio', 'Ratio of cache lookups that hit.',
+                  self._collect_cache_ratio),
+            Gauge('db_pool_checked_out', 'Connections in use.',
+                  lambda: self._collect_pool('checkedout')),
+            Gauge('db_pool_size', 'Configured size of the pool.',
+                  lambda: self._collect_pool('size')),
+            Gauge('db_pool_overflow', 'Connections above the pool size.',
+                  lambda: self._collect_pool('overflow')),
+        ]
+
+    def init_app(self, app: Flask, db: SQLAlchemy) -> None:
+        """Registers the request hooks, the SQLAlchemy event hooks and the
+        /metrics endpoint
+        :param app: The Flask application
+        :param db: The SQLAlchemy extension
+        """
+        self.db = db
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.add_url_rule('/metrics', 'metrics', self.render)
+
+        with app.app_context():
+            for engine in db.engines.values():
+                event.listen(engine, 'before_cursor_execute',
+                             self._before_cursor_execute)
+                event.listen(engine, 'after_cursor_execute',
+                             self._after_cursor_execute)
+
+    def record_cache(self, result: str) -> None:
+        """Records a cache lookup
+        :param result: 'hit', 'miss' or 'stale' for stale values served
+            while they are refreshed
+        """
+        self.cache.inc(result=result)
+
+    def render(self) -> Response:
+        """Renders every metric in the Prometheus text format
+        :return: The metrics response
+        """
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.description}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(metric.samples())
+        return Response('\n'.join(lines) + '\n',
+                        mimetype='text/plain; version=0.0.4')
+
+    def _before_request(self) -> None:
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+
+    def _after_request(self, response: Response) -> Response:
+        if request.endpoint == 'metrics' or 'metrics_start' not in g:
+            return response
+
+        endpoint = request.endpoint or 'unknown'
+        self.requests.inc(endpoint=endpoint, method=request.method,
+                          status=response.status_code)
+        self.request_latency.observe(time.perf_counter() - g.metrics_start,
+                                     endpoint=endpoint)
+        self.request_queries.observe(g.metrics_queries, endpoint=endpoint)
+        return response
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters,
+                               context, executemany) -> None:
+        conn.info.setdefault('metrics_start', []).append(
+            time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters,
+                              context, executemany) -> None:
+        elapsed = time.perf_counter() - conn.info['metrics_start'].pop()
+        self.queries.inc()
+        self.query_latency.observe(elapsed)
+        if has_request_context():
+            g.metrics_queries = g.get('metrics_queries', 0) + 1
+
+        if not has_app_context():
+            return
+        threshold = current_app.config.get('SLOW_QUERY_THRESHOLD')
+        if threshold is not None and elapsed >= threshold:
+            self.slow_queries.inc()
+            current_app.logger.warning('Slow query (%.3fs): %s', elapsed,
+                                       statement)
+
+    def _collect_cache_ratio(self) -> list[tuple[dict, float]]:
+        hits = self.cache.get(result='hit') + self.cache.get(result='stale')
+        total = hits + self.cache.get(result='miss')
+        return [({}, hits / total if total else 0.0)]
+
+    def _collect_pool(self, attribute: str) -> list[tuple[dict, float]]:
+        samples = []
+        for bind, engine in self.db.engines.items():
+            if isinstance(engine.pool, QueuePool):
+                samples.append(({'bind': bind or 'default'},
+                                getattr(engine.pool, attribute)()))
+        return samples
@@ -1,15 +1,61 @@
+import re
+import unicodedata
 from datetime import datetime
+from sqlalchemy.orm import validates
 
 from api.app import db
 
+SCHEME_PATTERN: re.Pattern = re.compile(r'^[a-z][a-z0-9+.-]*://')
+NAME_SEPARATOR_PATTERN: re.Pattern = re.compile(r'[\W_]+')
+
+
+def normalize_domain(website: str | None) -> str | None:
+    """Reduces a website to its lowercase domain without the scheme, the
+    www. prefix and the path
+    :param website: The website as written in the document
+    :return: The normalized domain
+    """
+    if not website:
+        return None
+    domain = SCHEME_PATTERN.sub('', website.strip().lower())
+    domain = re.split(r'[/?#]', domain, maxsplit=1)[0].strip('.')
+    if domain.startswith('www.'):
+        domain = domain[4:]
+    return domain[:128] or None
+
+
+def normalize_name(name: str | None) -> str | None:
+    """Reduces a name to casefolded words without accents and punctuation
+    :param name: The name as written in the document
+    :return: The normalized name
+    """
+    if not name:
+        return None
+    name = unicodedata.normalize('NFKD', name.casefold())
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    return ' '.join(NAME_SEPARATOR_PATTERN.sub(' ', name).split())[:255] \
+        or None
+
 
 class Company(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), index=True, unique=True)
-    gemh = db.Column(db.String(64), index=True, unique=True)
+    gemh = db.Column(db.BigInteger, index=True, unique=True)
     website = db.Column(db.String(128), index=True, unique=True)
     registration_date = db.Column(db.DateTime, index=True,
                                   default=datetime.utcnow)
+    domain = db.Column(db.String(128), index=True)
+    normalized_name = db.Column(db.String(255), index=True)
+
+    @validates('name')
+    def validate_name(self, key: str, name: str | None) -> str | None:
+        self.normalized_name = normalize_name(name)
+        return name
+
+    @validates('website')
+    def validate_website(self, key: str, website: str | None) -> str | None:
+        self.domain = normalize_domain(website)
+        return website
 
     def __repr__(self):
         return '<Company %s>' % self.name
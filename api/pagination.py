@@ -1,15 +1,140 @@
+import math
 import pickle
+import random
+import time
+import uuid
+from flask import abort, current_app, g
 from functools import wraps
 from apifairy import arguments, response
 from collections.abc import Callable
 from sqlalchemy.orm import Query
 from marshmallow import Schema
 
-from api.app import redis_client
+from api.app import metrics, redis_client
+from api.encoding import get_encoded
 from api.schemas import StringPaginationSchema, paginated_collection
 from config import config
 
 PaginationDict = dict[str, any]
+CacheEntry = dict[str, any]
+
+# Prefix of every response cache key, so the cache can be cleared on its own
+CACHE_KEY_PREFIX: str = 'cache:'
+
+
+def cached(key: str, load: Callable[[], any]) -> any:
+    """Get a value from the cache, protecting the database from stampedes
+
+    Entries are refreshed before they expire with a probability that grows
+    as the refresh time gets closer (probabilistic early expiration), and
+    refresh times are jittered so entries created together do not expire
+    together. Only the request holding the refresh lock runs the queries;
+    the others serve the stale entry, or wait for the new one if there is
+    none and fail with 503 if it is not loaded within CACHE_LOCK_TIMEOUT.
+    :param key: Cache key
+    :param load: Function computing the value on a miss
+    :return: The cached or computed value
+    """
+    if not current_app.config['CACHE_ENABLED']:
+        return load()
+
+    entry = _get_entry(key)
+    if entry is not None and not _needs_refresh(entry):
+        metrics.record_cache('hit')
+        g.cache_refresh_at = entry['refresh_at']
+        return entry['value']
+
+    lock_key = f'{key}:lock'
+    token = uuid.uuid4().hex
+    lock_timeout = current_app.config['CACHE_LOCK_TIMEOUT']
+    # The lock expires by then, so waiting longer only means other requests
+    # keep taking it
+    deadline = time.monotonic() + lock_timeout
+    while True:
+        if redis_client.set(lock_key, token, nx=True,
+                            px=int(lock_timeout * 1000)):
+            metrics.record_cache('miss')
+            try:
+                return _set_entry(key, load)
+            finally:
+                if redis_client.get(lock_key) == token.encode():
+                    redis_client.delete(lock_key)
+
+        if entry is not None:
+            metrics.record_cache('stale')
+            return entry['value']
+
+        # Another request is loading the value, wait for it or take over
+        # the lock if it is released or expires without a value
+        if time.monotonic() >= deadline:
+            abort(503, 'The response is still being computed.')
+        time.sleep(current_app.config['CACHE_LOCK_POLL'])
+        entry = _get_entry(key)
+        if entry is not None:
+            metrics.record_cache('hit')
+            g.cache_refresh_at = entry['refresh_at']
+            return entry['value']
+
+
+def _get_entry(key: str) -> CacheEntry | None:
+    """Get a cache entry
+    :param key: Cache key
+    :return: The entry or None if it is not cached
+    """
+    entry = redis_client.get(key)
+    if entry is None:
+        return None
+    entry = pickle.loads(entry)
+    # Ignore entries written before refresh times were stored
+    return entry if isinstance(entry, dict) and 'refresh_at' in entry \
+        else None
+
+
+def _set_entry(key: str, load: Callable[[], any]) -> any:
+    """Compute a value and cache it with a jittered refresh time, the entry
+    outlives the refresh time by CACHE_STALE_TIMEOUT so it can be served
+    while it is refreshed
+    :param key: Cache key
+    :param load: Function computing the value
+    :return: The computed value
+    """
+    start = time.time()
+    value = load()
+    end = time.time()
+
+    jitter = current_app.config['CACHE_TTL_JITTER']
+    ttl = current_app.config['CACHE_TIMEOUT'] * \
+        random.uniform(1 - jitter, 1 + jitter)
+    entry = {'value': value, 'refresh_at': end + ttl, 'delta': end - start}
+    redis_client.setex(key,
+                       int(ttl + current_app.config['CACHE_STALE_TIMEOUT']),
+                       pickle.dumps(entry))
+    g.cache_refresh_at = entry['refresh_at']
+    return value
+
+
+def _needs_refresh(entry: CacheEntry) -> bool:
+    """Decide if an entry should be refreshed, entries that are slower to
+    compute are refreshed earlier
+    :param entry: Cache entry
+    :return: True if the entry is stale or chosen for early refresh
+    """
+    beta = current_app.config['CACHE_EARLY_REFRESH_BETA']
+    early = -entry['delta'] * beta * math.log(1 - random.random())
+    return time.time() + early >= entry['refresh_at']
+
+
+def _cache_key(func: Callable, args: list, kwargs: dict,
+               pagination: PaginationDict) -> str:
+    """Get the cache key of a page
+    :param func: The decorated function
+    :param args: Arguments of the function
+    :param kwargs: Keyword arguments of the function
+    :param pagination: Pagination parameters
+    :return: Cache key
+    """
+    return (f'{CACHE_KEY_PREFIX}{func.__name__}_{pickle.dumps(args)}_'
+            f'{pickle.dumps(kwargs)}_{pickle.dumps(pagination)}')
 
 
 def paginated_response(schema: Schema,
@@ -42,41 +167,50 @@ def paginated_response(schema: Schema,
             if query is None:
                 return {}
 
-            count: int = query.count()
-
             limit: int = min(pagination.get('limit', max_limit), max_limit)
-            query: int = query.limit(limit)
-
             page: int = max(pagination.get('page', 1), 1)
-            if limit >= 1:
-                query = query.offset((page - 1) * limit)
-
-            # Check if the result is cached in Redis
-            cache_key = (f'{func.__name__}_{pickle.dumps(args)}_'
-                         f'{pickle.dumps(kwargs)}_{pickle.dumps(pagination)}')
-            cached_result = redis_client.get(cache_key)
-            if cached_result:
-                return pickle.loads(cached_result)
-
-            data: list = query.all()
-            result: dict = {
-                'data': data,
-                'pagination': {
-                    'page': page,
-                    'limit': limit,
-                    'count': len(data),
-                    'total': count
+
+            def load() -> dict:
+                """Run the count and page queries
+                :return: Paginated result
+                """
+                count: int = query.count()
+                page_query: Query = query.limit(limit)
+                if limit >= 1:
+                    page_query = page_query.offset((page - 1) * limit)
+
+                data: list = page_query.all()
+                return {
+                    'data': data,
+                    'pagination': {
+                        'page': page,
+                        'limit': limit,
+                        'count': len(data),
+                        'total': count
+                    }
                 }
-            }
 
-            # Cache the result in Redis
-            redis_client.setex(cache_key,
-                               config['default'].CACHE_TIMEOUT,
-                               pickle.dumps(result))
+            return cached(_cache_key(func, args, kwargs, pagination), load)
+
+        view = response(paginated_collection(
+            schema, pagination_schema=pagination_schema))(paginate)
+
+        @wraps(view)
+        def serve_encoded(*args, **kwargs):
+            """Serve the encoded response cached for the page, before it is
+            serialized again
+            :param args: Arguments to pass to the function
+            :param kwargs: Keyword arguments to pass to the function
+            :return: The cached response or the paginated response
+            """
+            if not current_app.config['CACHE_ENABLED']:
+                return view(*args, **kwargs)
 
-            return result
+            args: list = list(args)
+            pagination: PaginationDict = args[-1] if len(args) > 0 else {}
+            g.cache_key = _cache_key(func, args[:-1], kwargs, pagination)
+            return get_encoded(g.cache_key) or view(*args, **kwargs)
 
-        return arguments(pagination_schema)(response(paginated_collection(
-            schema, pagination_schema=pagination_schema))(paginate))
+        return arguments(pagination_schema)(serve_encoded)
 
     return inner
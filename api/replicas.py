@@ -0,0 +1,160 @@
+import itertools
+import os
+import threading
+import time
+from flask import Flask, current_app, g, has_app_context, \
+    has_request_context, request
+from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+READ_METHODS: tuple[str, ...] = ('GET', 'HEAD', 'OPTIONS')
+
+
+class ReplicaRouter:
+    """Chooses a read replica in round-robin order, skipping the replicas
+    that lag behind the primary by more than REPLICA_MAX_LAG seconds
+
+    The lag of every replica is measured every REPLICA_LAG_CHECK_INTERVAL
+    seconds by a background thread of each process, so requests never wait
+    for an unreachable replica. Reads use the primary until the replicas
+    have been measured and when no replica is healthy.
+
+    Args:
+        engines (dict[str, Engine]): The replica engines by bind key
+        max_lag (float): The maximum accepted lag in seconds
+        check_interval (float): Seconds between lag measurements
+    """
+    def __init__(self, engines: dict[str, Engine], max_lag: float,
+                 check_interval: float):
+        self.engines = engines
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._lags = {}
+        self._order = itertools.cycle(list(engines))
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def choose(self) -> Engine | None:
+        """Chooses the next healthy replica
+        :return: The replica engine or None to use the primary
+        """
+        self.start()
+        for _ in range(len(self.engines)):
+            key = next(self._order)
+            if self._lags.get(key, float('inf')) <= self.max_lag:
+                return self.engines[key]
+        return None
+
+    def start(self) -> None:
+        """Starts measuring the lag in the background, once in every
+        process since threads do not survive the fork of the workers
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            threading.Thread(target=self._run, daemon=True,
+                             name='replica-lag').start()
+
+    def _run(self) -> None:
+        while True:
+            self.refresh()
+            time.sleep(self.check_interval)
+
+    def refresh(self) -> None:
+        """Measures the lag of every replica
+        """
+        for key, engine in self.engines.items():
+            self._lags[key] = self.measure_lag(engine)
+
+    @staticmethod
+    def measure_lag(engine: Engine) -> float:
+        """Measures the replication lag of a database
+        :param engine: The replica engine
+        :return: The lag in seconds, infinite if the replica is unreachable
+            or not replicating
+        """
+        try:
+            with engine.connect() as connection:
+                if engine.dialect.name != 'mysql':
+                    connection.execute(text('SELECT 1'))
+                    return 0.0
+                try:
+                    status = connection.execute(
+                        text('SHOW REPLICA STATUS')).mappings().first()
+                except SQLAlchemyError:
+                    # MySQL before 8.0.22
+                    status = connection.execute(
+                        text('SHOW SLAVE STATUS')).mappings().first()
+        except SQLAlchemyError:
+            return float('inf')
+
+        if status is None:
+            # Not a replica, e.g. a local stand-in for one
+            return 0.0
+        lag = status.get('Seconds_Behind_Source',
+                         status.get('Seconds_Behind_Master'))
+        return float('inf') if lag is None else float(lag)
+
+
+class RoutingSession(Session):
+    """A session that sends the queries of read-only requests to a read
+    replica and everything else to the primary
+
+    Flushes, DML statements and requests that set ``g.use_primary`` always
+    use the primary.
+    """
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing \
+                and not getattr(clause, 'is_dml', False) \
+                and _reads_from_replica():
+            engine = _request_replica()
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+def _request_replica() -> Engine | None:
+    """Chooses the replica of the current request once, so that all its
+    queries, like the count and the page of a paginated response, read the
+    same data
+    :return: The replica engine or None to use the primary
+    """
+    if 'replica' not in g:
+        router = current_app.extensions.get('replica_router')
+        g.replica = router.choose() if router else None
+    return g.replica
+
+
+def _reads_from_replica() -> bool:
+    """Checks if the current request may read from a replica
+    :return: True for read-only requests
+    """
+    return has_app_context() and has_request_context() \
+        and request.method in READ_METHODS and not g.get('use_primary')
+
+
+def init_replicas(app: Flask, db: SQLAlchemy) -> None:
+    """Creates the replica router of an application from the replica binds
+    :param app: The Flask application
+    :param db: The SQLAlchemy extension
+    """
+    keys = app.config['REPLICA_BINDS']
+    if not keys:
+        return
+
+    with app.app_context():
+        engines = {key: db.engines[key] for key in keys}
+    app.extensions['replica_router'] = ReplicaRouter(
+        engines, app.config['REPLICA_MAX_LAG'],
+        app.config['REPLICA_LAG_CHECK_INTERVAL'])
+
+    @app.before_request
+    def forget_replica() -> None:
+        # The app context, and g with it, may outlive a request
+        g.pop('replica', None)
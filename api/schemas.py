@@ -1,3 +1,4 @@
+from apifairy import FileField
 from marshmallow import Schema
 
 from api.app import ma
@@ -37,9 +38,63 @@ class CompanySchema(ma.SQLAlchemyAutoSchema):
         load_instance = True
         include_fk = True
         ordered = True
+        exclude = ('domain', 'normalized_name')
 
     id = ma.auto_field()
     name = ma.auto_field()
     gemh = ma.auto_field()
     website = ma.auto_field()
-    registration_date = ma.auto_field()
\ No newline at end of file
+    registration_date = ma.auto_field()
+
+
+class CompanyFilterSchema(ma.Schema):
+    gemh = ma.Integer()
+    website = ma.String()
+    name = ma.String()
+
+
+class JobSchema(ma.Schema):
+    class Meta:
+        ordered = True
+
+    id = ma.String(dump_only=True)
+    status = ma.String(dump_only=True)
+    kind = ma.String(dump_only=True)
+    source = ma.String(dump_only=True)
+    total = ma.Integer(dump_only=True)
+    processed = ma.Integer(dump_only=True)
+    added = ma.Integer(dump_only=True)
+    duplicates = ma.Integer(dump_only=True)
+    failed = ma.Integer(dump_only=True)
+    throughput = ma.Float(dump_only=True)
+    created = ma.Float(dump_only=True)
+    started = ma.Float(dump_only=True)
+    finished = ma.Float(dump_only=True)
+    error = ma.String(dump_only=True)
+    errors = ma.List(ma.String(), dump_only=True)
+
+
+class FolderJobSchema(ma.Schema):
+    folder = ma.String(required=True)
+
+
+class UploadJobSchema(ma.Schema):
+    documents = ma.List(FileField(), required=True)
+
+
+class ExtractArgsSchema(ma.Schema):
+    save = ma.Boolean(load_default=False)
+
+
+class ExtractionSchema(ma.Schema):
+    class Meta:
+        ordered = True
+
+    document = ma.String(dump_only=True)
+    id = ma.Integer(dump_only=True)
+    name = ma.String(dump_only=True)
+    gemh = ma.Integer(dump_only=True)
+    website = ma.String(dump_only=True)
+    registration_date = ma.DateTime(dump_only=True)
+    confidence = ma.Dict(keys=ma.String(), values=ma.Float(), dump_only=True)
+    error = ma.String(dump_only=True)
@@ -0,0 +1,328 @@
+import json
+import logging
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import time
+from array import array
+from collections.abc import Callable, Iterable, Iterator
+from datetime import datetime
+from flask import Flask, current_app
+from redis.exceptions import RedisError
+
+from api.app import redis_client
+from api.models import Company
+
+SnapshotRecord = dict[str, any]
+
+logger = logging.getLogger(__name__)
+
+# Magic, number of records, number of GEMH index entries, size of the file,
+# which detects truncated copies, and the time the snapshot was started
+HEADER: struct.Struct = struct.Struct('<8sIIQd')
+# Key and absolute offset of the record
+INDEX_ENTRY: struct.Struct = struct.Struct('<QQ')
+# Length of the JSON encoded record that follows
+RECORD_LENGTH: struct.Struct = struct.Struct('<I')
+MAGIC: bytes = b'GEMHSNP3'
+# Hash of the companies updated since they were written to a snapshot, with
+# fields id:<id>:<time> and gemh:<gemh>:<time>, so trimming old fields never
+# removes a newer change of the same company
+CHANGES_KEY: str = 'snapshot:changes'
+# Changes this long before a snapshot was started still skip it, for hosts
+# whose clocks disagree
+CLOCK_SKEW: float = 60
+
+
+def write_snapshot(path: str, records: Iterable[SnapshotRecord]) -> int:
+    """Writes an immutable snapshot of companies and atomically replaces
+    the previous one
+
+    The file holds a header, an id index sorted by id, a GEMH index sorted
+    by GEMH and the JSON encoded records. The indexes are fixed size
+    entries, so lookups are binary searches over the memory-mapped file.
+    Records are streamed to a temporary file while only their keys and
+    offsets are kept in memory, since the indexes ahead of them are only
+    known once every record has been read.
+
+    :param path: The path of the snapshot
+    :param records: The companies as dicts with an id
+    :return: The number of records written
+    """
+    # Records are read after this, changes before it are in the snapshot
+    created = time.time()
+    folder = os.path.dirname(os.path.abspath(path))
+    ids, id_offsets = array('Q'), array('Q')
+    gemhs, gemh_offsets = array('Q'), array('Q')
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix='.snapshot-')
+    try:
+        with os.fdopen(fd, 'wb') as f, \
+                tempfile.TemporaryFile(dir=folder) as body:
+            for record in records:
+                record = dict(record)
+                if isinstance(record.get('registration_date'), datetime):
+                    record['registration_date'] = \
+                        record['registration_date'].isoformat()
+                data = json.dumps(record, ensure_ascii=False,
+                                  separators=(',', ':')).encode('utf-8')
+                offset = body.tell()
+                ids.append(record['id'])
+                id_offsets.append(offset)
+                if record.get('gemh'):
+                    gemhs.append(int(record['gemh']))
+                    gemh_offsets.append(offset)
+                body.write(RECORD_LENGTH.pack(len(data)))
+                body.write(data)
+
+            start = HEADER.size + INDEX_ENTRY.size * (len(ids) + len(gemhs))
+            f.write(HEADER.pack(MAGIC, len(ids), len(gemhs),
+                                start + body.tell(), created))
+            for keys, offsets in ((ids, id_offsets), (gemhs, gemh_offsets)):
+                for key, offset in _sorted_entries(keys, offsets):
+                    f.write(INDEX_ENTRY.pack(key, start + offset))
+            body.seek(0)
+            shutil.copyfileobj(body, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return len(ids)
+
+
+def _sorted_entries(keys: array,
+                    offsets: array) -> Iterator[tuple[int, int]]:
+    """Sorts the entries of an index by key
+    :param keys: The keys of the entries
+    :param offsets: The offsets of the entries, relative to the records
+    :return: An iterator of keys and offsets sorted by key
+    """
+    if all(keys[i] <= keys[i + 1] for i in range(len(keys) - 1)):
+        return zip(keys, offsets)
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    return ((keys[i], offsets[i]) for i in order)
+
+
+def export_snapshot(path: str) -> int:
+    """Writes a snapshot of every company in the database
+    :param path: The path of the snapshot
+    :return: The number of records written
+    """
+    try:
+        previous = Snapshot(path).created
+    except (OSError, ValueError):
+        previous = None
+
+    records = (
+        {'id': company.id,
+         'name': company.name,
+         'gemh': company.gemh,
+         'website': company.website,
+         'registration_date': company.registration_date}
+        for company in Company.query.order_by(Company.id).yield_per(1000))
+    count = write_snapshot(path, records)
+
+    # Workers move past the previous snapshot, so the changes it already
+    # holds are not needed anymore
+    if previous is not None:
+        old = [field for field, changed in read_changes().items()
+               if float(changed) < previous - CLOCK_SKEW]
+        if old:
+            redis_client.hdel(CHANGES_KEY, *old)
+    return count
+
+
+def record_change(id: int, gemh: int | None) -> None:
+    """Records an update of a company, so the snapshots written before it
+    leave the company to the database
+    :param id: The id of the company
+    :param gemh: The GEMH number of the company
+    """
+    if 'snapshot' not in current_app.extensions:
+        return
+    now = time.time()
+    changes = {f'id:{id}:{now}': now}
+    if gemh:
+        changes[f'gemh:{gemh}:{now}'] = now
+    redis_client.hset(CHANGES_KEY, mapping=changes)
+
+
+def read_changes() -> dict[bytes, bytes]:
+    """Reads the recorded updates of companies
+    :return: The times of the updates by field
+    """
+    return redis_client.hgetall(CHANGES_KEY)
+
+
+class Snapshot:
+    """A read-only, memory-mapped snapshot of companies
+
+    Args:
+        path (str): The path of the snapshot
+    """
+    def __init__(self, path: str):
+        with open(path, 'rb') as f:
+            self.stat = os.fstat(f.fileno())
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) < HEADER.size:
+            raise ValueError(f'{path} is not a company snapshot')
+        magic, self.count, self.gemh_count, size, self.created = \
+            HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a company snapshot')
+        if size != len(self._map):
+            raise ValueError(f'{path} is truncated')
+        self._id_index = HEADER.size
+        self._gemh_index = self._id_index + INDEX_ENTRY.size * self.count
+        self.changed_ids: frozenset[int] = frozenset()
+        self.changed_gemhs: frozenset[int] = frozenset()
+
+    def skip_changes(self, changes: dict[bytes, bytes]) -> None:
+        """Skips the companies updated since the snapshot was started, so
+        they are looked up in the database
+        :param changes: The times of the updates by field
+        """
+        since = self.created - CLOCK_SKEW
+        changed = [field.decode().split(':')[:2]
+                   for field, changed_at in changes.items()
+                   if float(changed_at) >= since]
+        self.changed_ids = frozenset(
+            int(key) for kind, key in changed if kind == 'id')
+        self.changed_gemhs = frozenset(
+            int(key) for kind, key in changed if kind == 'gemh')
+
+    def get_by_id(self, id: int) -> SnapshotRecord | None:
+        """Looks up a company by id
+        :param id: The id of the company
+        :return: The company or None if it is not in the snapshot or was
+            updated since
+        """
+        if id in self.changed_ids:
+            return None
+        return self._lookup(self._id_index, self.count, id)
+
+    def get_by_gemh(self, gemh: int) -> SnapshotRecord | None:
+        """Looks up a company by GEMH number
+        :param gemh: The GEMH number of the company
+        :return: The company or None if it is not in the snapshot or was
+            updated since
+        """
+        if gemh in self.changed_gemhs:
+            return None
+        return self._lookup(self._gemh_index, self.gemh_count, gemh)
+
+    def _lookup(self, index: int, count: int,
+                key: int) -> SnapshotRecord | None:
+        """Binary searches an index of the snapshot
+        :param index: The offset of the index
+        :param count: The number of index entries
+        :param key: The key to find
+        :return: The record or None if the key is not in the index
+        """
+        if key < 0:
+            return None
+
+        low, high = 0, count
+        while low < high:
+            middle = (low + high) // 2
+            entry_key, offset = INDEX_ENTRY.unpack_from(
+                self._map, index + middle * INDEX_ENTRY.size)
+            if entry_key < key:
+                low = middle + 1
+            elif entry_key > key:
+                high = middle
+            else:
+                return self._read(offset)
+        return None
+
+    def _read(self, offset: int) -> SnapshotRecord:
+        """Decodes the record at an offset
+        :param offset: The offset of the record
+        :return: The record
+        """
+        length, = RECORD_LENGTH.unpack_from(self._map, offset)
+        start = offset + RECORD_LENGTH.size
+        record = json.loads(self._map[start:start + length])
+        if record.get('registration_date'):
+            record['registration_date'] = datetime.fromisoformat(
+                record['registration_date'])
+        return record
+
+
+class SnapshotStore:
+    """Serves the current snapshot and swaps to a new one when the file is
+    replaced
+
+    Args:
+        path (str): The path of the snapshot
+        check_interval (float): Seconds between checks for a new snapshot
+        changes (Callable): Reads the updates of companies that the snapshot
+            skips, checked as often as the file
+    """
+    def __init__(self, path: str, check_interval: float = 1,
+                 changes: Callable[[], dict[bytes, bytes]] | None = None):
+        self.path = path
+        self.check_interval = check_interval
+        self.changes = changes
+        self._snapshot = None
+        self._checked = float('-inf')
+        self._invalid = None
+
+    def get(self) -> Snapshot | None:
+        """Gets the current snapshot, reopening the file if it was replaced
+        by a valid snapshot
+        :return: The snapshot or None if there is no valid snapshot file
+        """
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return self._snapshot
+        self._checked = now
+
+        self._snapshot = self._open()
+        if self._snapshot is not None and self.changes is not None:
+            try:
+                self._snapshot.skip_changes(self.changes())
+            except RedisError as e:
+                # Updated companies cannot be told apart, so every lookup
+                # goes to the database
+                logger.error('Cannot read the snapshot changes: %s', e)
+                self._snapshot = None
+        return self._snapshot
+
+    def _open(self) -> Snapshot | None:
+        """Opens the snapshot file if it was replaced by a valid snapshot
+        :return: The snapshot or None if there is no valid snapshot file
+        """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+
+        current = self._snapshot
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version == self._invalid or current is not None and \
+                (current.stat.st_ino, current.stat.st_mtime_ns) == version:
+            return current
+        try:
+            # The previous map is closed once no request uses it anymore
+            return Snapshot(self.path)
+        except (OSError, ValueError) as e:
+            # Keep serving the previous snapshot until a valid one replaces
+            # the file
+            logger.error('Cannot open the snapshot %s: %s', self.path, e)
+            self._invalid = version
+        return current
+
+
+def init_snapshot(app: Flask) -> None:
+    """Serves company lookups from the snapshot if one is configured
+    :param app: The Flask application
+    """
+    if app.config['SNAPSHOT_PATH']:
+        app.extensions['snapshot'] = SnapshotStore(
+            app.config['SNAPSHOT_PATH'],
+            app.config['SNAPSHOT_CHECK_INTERVAL'],
+            read_changes)
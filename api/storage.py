@@ -0,0 +1,270 @@
+import fnmatch
+import time
+from collections import deque
+from threading import Condition
+from flask import Flask
+from flask_sqlalchemy import SQLAlchemy
+from redis import Redis
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+SQLITE_PRAGMAS: dict[str, str | int] = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'temp_store': 'MEMORY',
+    'cache_size': -64000,
+    'mmap_size': 256 * 1024 * 1024,
+    'busy_timeout': 5000,
+}
+
+
+def configure_engine(engine: Engine, read_only: bool = False) -> None:
+    """Tunes every new connection of an engine for its database backend
+    :param engine: The SQLAlchemy engine
+    :param read_only: Reject writes on SQLite connections
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma}={value}')
+        if read_only:
+            cursor.execute('PRAGMA query_only=ON')
+        cursor.close()
+
+
+def init_storage(app: Flask, db: SQLAlchemy) -> None:
+    """Tunes the engines of an application for their database backends
+    :param app: The Flask application
+    :param db: The SQLAlchemy extension
+    """
+    with app.app_context():
+        for engine in db.engines.values():
+            configure_engine(engine, app.config['SQLITE_READ_ONLY'])
+
+
+class MemoryCache:
+    """An in-process stand-in for the subset of the Redis client used by the
+    API, for embedded deployments without a Redis server
+
+    Values are stored as bytes like Redis returns them. The cache is local
+    to the process, so ingest jobs can only be consumed by a worker running
+    in the same process.
+    """
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._condition = Condition()
+
+    @staticmethod
+    def _encode(value: any) -> bytes:
+        if isinstance(value, bytes):
+            return value
+        return str(value).encode()
+
+    def _get(self, key: str, default: any = None) -> any:
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.monotonic():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return self._data.get(key, default)
+
+    def _expire(self, key: str, seconds: float | None) -> None:
+        if seconds is None:
+            self._expires.pop(key, None)
+        else:
+            self._expires[key] = time.monotonic() + seconds
+
+    def get(self, key: str) -> bytes | None:
+        with self._condition:
+            return self._get(key)
+
+    def set(self, key: str, value: any, ex: float | None = None,
+            px: int | None = None, nx: bool = False) -> bool | None:
+        with self._condition:
+            if nx and self._get(key) is not None:
+                return None
+            self._data[key] = self._encode(value)
+            self._expire(key, px / 1000 if px is not None else ex)
+            return True
+
+    def setex(self, key: str, seconds: float, value: any) -> bool:
+        return self.set(key, value, ex=seconds)
+
+    def delete(self, *keys: str) -> int:
+        with self._condition:
+            deleted = 0
+            for key in keys:
+                deleted += self._get(key) is not None
+                self._data.pop(key, None)
+                self._expires.pop(key, None)
+            return deleted
+
+    def expire(self, key: str, seconds: float) -> bool:
+        with self._condition:
+            if self._get(key) is None:
+                return False
+            self._expire(key, seconds)
+            return True
+
+    def keys(self, pattern: str = '*') -> list[bytes]:
+        with self._condition:
+            return [key.encode() for key in list(self._data)
+                    if self._get(key) is not None
+                    and fnmatch.fnmatchcase(key, pattern)]
+
+    def flushall(self) -> bool:
+        with self._condition:
+            self._data.clear()
+            self._expires.clear()
+            return True
+
+    def flushdb(self) -> bool:
+        return self.flushall()
+
+    def hset(self, key: str, field: str | None = None, value: any = None,
+             mapping: dict | None = None) -> int:
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        with self._condition:
+            hash_ = self._data.setdefault(key, {})
+            added = len(set(items) - set(hash_))
+            for name, item in items.items():
+                hash_[str(name)] = self._encode(item)
+            return added
+
+    def hsetnx(self, key: str, field: str, value: any) -> bool:
+        with self._condition:
+            hash_ = self._data.setdefault(key, {})
+            if field in hash_:
+                return False
+            hash_[field] = self._encode(value)
+            return True
+
+    def hget(self, key: str, field: str) -> bytes | None:
+        with self._condition:
+            return self._get(key, {}).get(field)
+
+    def hmget(self, key: str, *fields: str) -> list[bytes | None]:
+        with self._condition:
+            hash_ = self._get(key, {})
+            return [hash_.get(field) for field in fields]
+
+    def hgetall(self, key: str) -> dict[bytes, bytes]:
+        with self._condition:
+            return {name.encode(): value
+                    for name, value in self._get(key, {}).items()}
+
+    def hdel(self, key: str, *fields: str | bytes) -> int:
+        with self._condition:
+            hash_ = self._get(key, {})
+            deleted = 0
+            for field in fields:
+                if isinstance(field, bytes):
+                    field = field.decode()
+                deleted += hash_.pop(field, None) is not None
+            return deleted
+
+    def hincrby(self, key: str, field: str, amount: int = 1) -> int:
+        with self._condition:
+            hash_ = self._data.setdefault(key, {})
+            value = int(hash_.get(field, b'0')) + amount
+            hash_[field] = self._encode(value)
+            return value
+
+    def lpush(self, key: str, *values: any) -> int:
+        with self._condition:
+            list_ = self._data.setdefault(key, deque())
+            list_.extendleft(self._encode(value) for value in values)
+            self._condition.notify_all()
+            return len(list_)
+
+    def rpush(self, key: str, *values: any) -> int:
+        with self._condition:
+            list_ = self._data.setdefault(key, deque())
+            list_.extend(self._encode(value) for value in values)
+            self._condition.notify_all()
+            return len(list_)
+
+    def lrange(self, key: str, start: int, end: int) -> list[bytes]:
+        with self._condition:
+            list_ = list(self._get(key, ()))
+            return list_[start:None if end == -1 else end + 1]
+
+    def lrem(self, key: str, count: int, value: any) -> int:
+        with self._condition:
+            list_ = self._get(key)
+            if not list_:
+                return 0
+            value = self._encode(value)
+            kept, removed = deque(), 0
+            for item in list_:
+                if item == value and (not count or removed < count):
+                    removed += 1
+                else:
+                    kept.append(item)
+            self._data[key] = kept
+            return removed
+
+    def _wait(self, key: str, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout if timeout else None
+        while not self._get(key):
+            remaining = None if deadline is None \
+                else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return False
+            self._condition.wait(remaining)
+        return True
+
+    def brpop(self, key: str,
+              timeout: float = 0) -> tuple[bytes, bytes] | None:
+        with self._condition:
+            if not self._wait(key, timeout):
+                return None
+            return key.encode(), self._data[key].pop()
+
+    def brpoplpush(self, source: str, destination: str,
+                   timeout: float = 0) -> bytes | None:
+        with self._condition:
+            if not self._wait(source, timeout):
+                return None
+            value = self._data[source].pop()
+            self._data.setdefault(destination, deque()).appendleft(value)
+            return value
+
+    def pipeline(self) -> 'MemoryPipeline':
+        return MemoryPipeline(self)
+
+
+class MemoryPipeline:
+    """Queues commands of a MemoryCache and runs them on execute
+    """
+    def __init__(self, cache: MemoryCache):
+        self._cache = cache
+        self._commands = []
+
+    def __getattr__(self, name: str):
+        method = getattr(self._cache, name)
+
+        def queue(*args, **kwargs) -> 'MemoryPipeline':
+            self._commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self) -> list:
+        commands, self._commands = self._commands, []
+        return [method(*args, **kwargs) for method, args, kwargs in commands]
+
+
+def create_cache(config) -> Redis | MemoryCache:
+    """Creates the cache client selected by the configuration
+    :param config: The configuration
+    :return: A Redis client or an in-process cache
+    """
+    if config.CACHE_BACKEND == 'memory':
+        return MemoryCache()
+    return Redis(host=config.REDIS_HOST, port=6379, db=config.REDIS_DB)
@@ -0,0 +1,360 @@
+"""Load tests the API under gunicorn with a realistic traffic mix
+
+Seeds the company table of the given database, then starts gunicorn once
+per worker configuration and cache setting and replays id lookups, GEMH
+lookups, list pages, deep pagination and filters against it. A company
+table holding other rows is only replaced with --reset, and only the
+response cache keys of the given Redis database are cleared between runs.
+
+Usage:
+    CACHE_BACKEND=memory python -m benchmarks.loadtest \
+        --database-uri sqlite:////tmp/loadtest.sqlite3 --rows 1000000 \
+        --workers 1x1,4x1,4x4 --cache on,off --duration 30
+"""
+import argparse
+import bisect
+import http.client
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable
+from redis import Redis
+from sqlalchemy import create_engine, func, insert, select
+
+from api.models import Company
+from api.pagination import CACHE_KEY_PREFIX
+from api.storage import configure_engine
+from benchmarks.storage import company_rows
+from config import basedir, config
+
+SEED_BATCH_SIZE: int = 10000
+PAGE_SIZE: int = 20
+DEFAULT_MIX: str = 'lookup=50,gemh=10,list=25,deep=10,filter=5'
+
+
+def skewed(count: int) -> int:
+    """Picks a number between 1 and count, small numbers are much more
+    likely like popular companies and first pages are
+    :param count: The largest number
+    :return: The number
+    """
+    return max(1, min(count, int(count ** random.random())))
+
+
+def traffic(rows: int) -> dict[str, Callable[[], str]]:
+    """Builds the request paths of every kind of traffic
+    :param rows: The number of companies in the database
+    :return: The functions making a path by kind
+    """
+    pages = max(1, rows // PAGE_SIZE)
+    return {
+        'lookup': lambda: f'/company/{random.randint(1, rows)}',
+        'gemh': lambda: f'/company/gemh/{100000000 + skewed(rows)}',
+        'list': lambda: f'/company?page={skewed(10)}&limit={PAGE_SIZE}',
+        'deep': lambda: f'/company?page={random.randint(1, pages)}'
+                        f'&limit={PAGE_SIZE}',
+        'filter': lambda: f'/company?website=www.company-{skewed(rows)}.gr',
+    }
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    """Parses a traffic mix
+    :param mix: Comma separated kind=weight pairs
+    :return: The weights by kind
+    """
+    weights = {}
+    for item in mix.split(','):
+        kind, weight = item.split('=')
+        weights[kind.strip()] = float(weight)
+    return weights
+
+
+def seed(uri: str, rows: int, reset: bool) -> None:
+    """Fills the company table with generated rows, unless it already holds
+    exactly that many
+    :param uri: The SQLAlchemy database URI
+    :param rows: The number of rows
+    :param reset: Replace a table holding a different number of rows
+    """
+    engine = create_engine(uri)
+    configure_engine(engine)
+    table = Company.__table__
+    table.create(engine, checkfirst=True)
+    with engine.connect() as connection:
+        count = connection.execute(
+            select(func.count()).select_from(table)).scalar()
+    if count == rows:
+        print(f'Reusing {rows:,} seeded companies')
+        engine.dispose()
+        return
+    if count and not reset:
+        engine.dispose()
+        sys.exit(f'The company table of {engine.url} holds {count:,} rows, '
+                 f'pass --reset to replace them with {rows:,} generated '
+                 f'companies')
+
+    print(f'Seeding {rows:,} companies')
+    start = time.perf_counter()
+    if count:
+        # Recreated so the generated ids start from 1 again
+        table.drop(engine)
+        table.create(engine)
+    with engine.begin() as connection:
+        for first in range(1, rows + 1, SEED_BATCH_SIZE):
+            connection.execute(insert(table), company_rows(
+                min(SEED_BATCH_SIZE, rows - first + 1), first))
+    print(f'Seeded in {time.perf_counter() - start:.1f}s')
+    engine.dispose()
+
+
+def clear_cache(redis_db: int) -> None:
+    """Deletes the response cache entries, leaving the other keys like the
+    queued ingest jobs alone
+    :param redis_db: The Redis database of the cache
+    """
+    client = Redis(host=config['default'].REDIS_HOST, port=6379, db=redis_db)
+    keys = list(client.scan_iter(match=f'{CACHE_KEY_PREFIX}*', count=1000))
+    for first in range(0, len(keys), 1000):
+        client.delete(*keys[first:first + 1000])
+    client.close()
+
+
+def free_port() -> int:
+    """Finds a free local port
+    :return: The port
+    """
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def start_server(workers: int, threads: int, cache: bool, port: int,
+                 log: str | None, env: dict[str, str]) -> subprocess.Popen:
+    """Starts gunicorn and waits until it answers
+    :param workers: The number of worker processes
+    :param threads: The number of threads per worker
+    :param cache: Whether the response cache is enabled
+    :param port: The port to listen on
+    :param log: The file collecting the server output
+    :param env: The environment of the app, with its database and Redis
+    :return: The gunicorn process
+    """
+    env = dict(env, CACHE_ENABLED='true' if cache else 'false')
+    output = open(log, 'a') if log else subprocess.DEVNULL
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'main:app',
+         '--config', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{port}',
+         '--workers', str(workers), '--threads', str(threads)],
+        cwd=basedir, env=env, stdout=output, stderr=output)
+
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with {server.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port,
+                                                    timeout=5)
+            connection.request('GET', '/company/1')
+            connection.getresponse().read()
+            connection.close()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    stop_server(server)
+    raise RuntimeError('gunicorn did not start within 60s')
+
+
+def stop_server(server: subprocess.Popen) -> None:
+    """Stops gunicorn
+    :param server: The gunicorn process
+    """
+    server.terminate()
+    try:
+        server.wait(30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def replay(port: int, paths: dict[str, Callable[[], str]],
+           weights: dict[str, float], concurrency: int,
+           duration: float) -> dict[str, dict[str, list]]:
+    """Sends requests from several keep-alive connections for a while
+    :param port: The port of the server
+    :param paths: The functions making a path by kind
+    :param weights: The share of the traffic by kind
+    :param concurrency: The number of concurrent connections
+    :param duration: The duration in seconds
+    :return: The latencies and errors by kind
+    """
+    kinds = list(weights)
+    cumulative = list(itertools.accumulate(weights[kind] for kind in kinds))
+    results = defaultdict(lambda: {'latencies': [], 'errors': 0})
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client() -> None:
+        local = defaultdict(lambda: {'latencies': [], 'errors': 0})
+        connection = http.client.HTTPConnection('127.0.0.1', port,
+                                                timeout=30)
+        while time.monotonic() < deadline:
+            kind = kinds[bisect.bisect(
+                cumulative, random.random() * cumulative[-1])]
+            start = time.perf_counter()
+            try:
+                connection.request('GET', paths[kind](),
+                                   headers={'Accept-Encoding': 'gzip'})
+                response = connection.getresponse()
+                response.read()
+                failed = response.status >= 500
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port,
+                                                        timeout=30)
+                failed = True
+            latency = time.perf_counter() - start
+            if failed:
+                local[kind]['errors'] += 1
+            else:
+                local[kind]['latencies'].append(latency)
+        connection.close()
+
+        with lock:
+            for kind, result in local.items():
+                results[kind]['latencies'].extend(result['latencies'])
+                results[kind]['errors'] += result['errors']
+
+    clients = [threading.Thread(target=client) for _ in range(concurrency)]
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    return {kind: results[kind] for kind in kinds if kind in results}
+
+
+def percentile(values: list[float], share: float) -> float:
+    """Computes a percentile with the nearest-rank method
+    :param values: The sorted values
+    :param share: The percentile between 0 and 1
+    :return: The percentile or 0 without values
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, round(share * len(values)) - 1))]
+
+
+def summarize(results: dict[str, dict[str, list]],
+              duration: float) -> dict[str, dict[str, float]]:
+    """Computes the throughput and latency percentiles of a run
+    :param results: The latencies and errors by kind
+    :param duration: The duration of the run in seconds
+    :return: The statistics by kind and in total, latencies in ms
+    """
+    results = dict(results)
+    results['total'] = {
+        'latencies': [latency for result in results.values()
+                      for latency in result['latencies']],
+        'errors': sum(result['errors'] for result in results.values())}
+
+    summary = {}
+    for kind, result in results.items():
+        latencies = sorted(result['latencies'])
+        summary[kind] = {
+            'requests': len(latencies),
+            'errors': result['errors'],
+            'rps': len(latencies) / duration,
+            'p50': percentile(latencies, 0.50) * 1000,
+            'p95': percentile(latencies, 0.95) * 1000,
+            'p99': percentile(latencies, 0.99) * 1000,
+        }
+    return summary
+
+
+def print_summary(name: str, summary: dict[str, dict[str, float]]) -> None:
+    """Prints the statistics of a run
+    :param name: The name of the configuration
+    :param summary: The statistics by kind
+    """
+    print(name)
+    print(f'  {"kind":<8} {"requests":>9} {"errors":>7} {"rps":>9} '
+          f'{"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8}')
+    for kind, stats in summary.items():
+        print(f'  {kind:<8} {stats["requests"]:>9} {stats["errors"]:>7} '
+              f'{stats["rps"]:>9.1f} {stats["p50"]:>8.1f} '
+              f'{stats["p95"]:>8.1f} {stats["p99"]:>8.1f}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database-uri', required=True,
+                        help='SQLAlchemy URI of the database to seed and '
+                             'serve')
+    parser.add_argument('--redis-db', type=int,
+                        help='Redis database of the response cache, '
+                             'required with CACHE_BACKEND=redis')
+    parser.add_argument('--reset', action='store_true',
+                        help='Replace a company table holding a different '
+                             'number of rows')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--workers', default='2x1',
+                        help='Comma separated WORKERSxTHREADS configurations')
+    parser.add_argument('--cache', default='on,off',
+                        help='Comma separated cache settings, on or off')
+    parser.add_argument('--mix', default=DEFAULT_MIX,
+                        help='Comma separated kind=weight traffic shares')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30)
+    parser.add_argument('--warmup', type=float, default=5)
+    parser.add_argument('--json', help='Also write the results to this file')
+    parser.add_argument('--log', help='Append the gunicorn output to this '
+                                      'file')
+    args = parser.parse_args()
+    redis_cache = config['default'].CACHE_BACKEND == 'redis'
+    if redis_cache and args.redis_db is None:
+        parser.error('--redis-db is required with CACHE_BACKEND=redis')
+
+    # The app served by gunicorn uses the given database and Redis database
+    env = dict(os.environ, DATABASE_URI=args.database_uri)
+    env.setdefault('FLASK_CONFIG', 'development')
+    if args.redis_db is not None:
+        env['REDIS_DB'] = str(args.redis_db)
+    seed(args.database_uri, args.rows, args.reset)
+    paths = traffic(args.rows)
+    weights = parse_mix(args.mix)
+
+    report = {}
+    for workers_threads in args.workers.split(','):
+        workers, threads = (int(n) for n in workers_threads.split('x'))
+        for cache in args.cache.split(','):
+            if redis_cache:
+                # Every run starts with a cold cache
+                clear_cache(args.redis_db)
+
+            port = free_port()
+            server = start_server(workers, threads, cache == 'on', port,
+                                  args.log, env)
+            try:
+                replay(port, paths, weights, args.concurrency, args.warmup)
+                results = replay(port, paths, weights, args.concurrency,
+                                 args.duration)
+            finally:
+                stop_server(server)
+
+            name = f'{workers} workers x {threads} threads, cache {cache}'
+            report[name] = summarize(results, args.duration)
+            print_summary(name, report[name])
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
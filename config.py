@@ -5,15 +5,42 @@ basedir = os.path.abspath(os.path.dirname(__file__))
 
 class Config:
     # Flask
-    JSON_SORT_KEYS: bool = False
+    MAX_CONTENT_LENGTH: int = 16 * 1024 * 1024
+
+    # Response encoding, JSON_ENCODER is 'orjson' or 'json'
+    JSON_ENCODER: str = os.environ.get('JSON_ENCODER', 'orjson')
+    # Responses smaller than this many bytes are sent uncompressed
+    COMPRESS_MIN_SIZE: int = 1024
+    COMPRESS_LEVEL: int = 6
+    COMPRESS_BROTLI_QUALITY: int = 5
 
     # SQLAlchemy
     SQLALCHEMY_TRACK_MODIFICATIONS: bool = True
     SQLALCHEMY_DATABASE_URI: str | None = None
 
+    # Metrics, queries slower than this many seconds are logged
+    SLOW_QUERY_THRESHOLD: float | None = (
+        float(os.environ['SLOW_QUERY_THRESHOLD'])
+        if os.environ.get('SLOW_QUERY_THRESHOLD') else None)
+
+    # Storage backend, 'mysql' or 'sqlite'
+    DATABASE_BACKEND: str = os.environ.get('DATABASE_BACKEND', 'mysql')
+    SQLITE_FOLDER: str = os.environ.get('SQLITE_FOLDER', basedir)
+    SQLITE_READ_ONLY: bool = os.environ.get('SQLITE_READ_ONLY') == 'true'
+
     # MySQL
     MYSQL_SERVER: str = os.environ.get('MYSQL_SERVER')
 
+    # Replaces the database of every configuration, e.g. for load tests
+    DATABASE_URI: str | None = os.environ.get('DATABASE_URI')
+
+    # Read replicas, comma separated database URIs used by GET requests
+    REPLICA_DATABASE_URIS: list[str] = [
+        uri.strip() for uri in
+        os.environ.get('REPLICA_DATABASE_URIS', '').split(',') if uri.strip()]
+    REPLICA_MAX_LAG: float = float(os.environ.get('REPLICA_MAX_LAG', 5))
+    REPLICA_LAG_CHECK_INTERVAL: float = 10
+
     # Data pagination
     ITEMS_PER_BODY: int = 20
 
@@ -22,14 +49,48 @@ class Config:
     APIFAIRY_VERSION: str = os.environ.get('APIFAIRY_VERSION')
     APIFAIRY_UI: str = os.environ.get('APIFAIRY_UI')
 
+    # Cache backend, 'redis' or 'memory'
+    CACHE_BACKEND: str = os.environ.get('CACHE_BACKEND', 'redis')
+    # Disables the response cache, e.g. to measure the API without it
+    CACHE_ENABLED: bool = os.environ.get('CACHE_ENABLED') != 'false'
+
     # Redis
     REDIS_HOST = os.environ.get('REDIS_HOST')
+    REDIS_DB: int = int(os.environ.get('REDIS_DB', 0))
     CACHE_TIMEOUT: int = 60 * 60 * 24
+    # Stale entries are served for this long while one request refreshes
+    CACHE_STALE_TIMEOUT: int = 60 * 60
+    CACHE_TTL_JITTER: float = 0.1
+    CACHE_EARLY_REFRESH_BETA: float = 1.0
+    CACHE_LOCK_TIMEOUT: float = 10
+    CACHE_LOCK_POLL: float = 0.05
+
+    # Snapshot served to company lookups, written by flask extract
+    SNAPSHOT_PATH: str | None = os.environ.get('SNAPSHOT_PATH')
+    SNAPSHOT_CHECK_INTERVAL: float = 1
+
+    # Ingest jobs
+    INGEST_ROOT: str = os.environ.get('INGEST_ROOT', basedir)
+    INGEST_QUEUE: str = 'ingest:queue'
+    # Jobs not updated by their worker for this many seconds are recovered
+    INGEST_JOB_TIMEOUT: float = 300
+    EXTRACT_MAX_DOCUMENTS: int = 1000
 
     def __init__(self, username, password, database):
-        self.SQLALCHEMY_DATABASE_URI = (
-            f'mysql://{username}:{password}@'
-            f'{self.MYSQL_SERVER}/{database}')
+        self.SQLALCHEMY_BINDS = {
+            f'replica_{index}': uri
+            for index, uri in enumerate(self.REPLICA_DATABASE_URIS)}
+        self.REPLICA_BINDS = list(self.SQLALCHEMY_BINDS)
+
+        if self.DATABASE_URI:
+            self.SQLALCHEMY_DATABASE_URI = self.DATABASE_URI
+        elif self.DATABASE_BACKEND == 'sqlite':
+            self.SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(
+                self.SQLITE_FOLDER, f'{database or "gemh"}.sqlite3')
+        else:
+            self.SQLALCHEMY_DATABASE_URI = (
+                f'mysql://{username}:{password}@'
+                f'{self.MYSQL_SERVER}/{database}')
 
 
 class DevelopmentConfig(Config):
@@ -44,7 +105,12 @@ class DevelopmentConfig(Config):
 class TestingConfig(Config):
     # For validating API urls
     SERVER_NAME: str = '127.0.0.1:5000'
-    
+    # Keeps test jobs away from the workers of a deployment sharing Redis
+    INGEST_QUEUE: str = 'ingest:test:queue'
+    # The tests empty their Redis database, so they never share the one of
+    # a deployment
+    REDIS_DB: int = int(os.environ.get('REDIS_TEST_DB', 1))
+
     def __init__(self):
         super().__init__(
             os.environ.get('MYSQL_TEST_USERNAME'),
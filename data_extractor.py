@@ -1,9 +1,78 @@
 #!/usr/bin/python
+import json
 import os
 import re
-from warnings import warn
+import tarfile
+import traceback
+import zipfile
+from collections import Counter
+from collections.abc import Callable, Iterable, Iterator
+from dataclasses import dataclass
 from datetime import datetime
 from difflib import SequenceMatcher
+from functools import partial
+from typing import IO, NamedTuple
+
+
+class Candidate(NamedTuple):
+    """A candidate value found in a document
+
+    Attributes:
+        value: The extracted value
+        position: The index of the value in the list of words
+        confidence: The match ratio of the word that introduced the value
+    """
+    value: any
+    position: int
+    confidence: float
+
+
+@dataclass(frozen=True, slots=True)
+class ExtractionResult:
+    """The candidates found for a single field of a document
+
+    The chosen value is the candidate with the highest confidence, ties are
+    broken by the earliest position in the document.
+
+    Attributes:
+        candidates (tuple[Candidate]): Every candidate in document order
+    """
+    candidates: tuple[Candidate, ...] = ()
+
+    @property
+    def best(self) -> Candidate | None:
+        """The chosen candidate or None if there are no candidates
+        """
+        if not self.candidates:
+            return None
+        return min(self.candidates,
+                   key=lambda c: (-c.confidence, c.position))
+
+    @property
+    def value(self) -> any:
+        """The chosen value or an empty string if there are no candidates
+        """
+        best = self.best
+        return '' if best is None else best.value
+
+    @property
+    def confidence(self) -> float:
+        """The confidence of the chosen value
+        """
+        best = self.best
+        return 0.0 if best is None else best.confidence
+
+    @property
+    def is_missing(self) -> bool:
+        """Whether no candidates were found
+        """
+        return not self.candidates
+
+    @property
+    def is_ambiguous(self) -> bool:
+        """Whether more than one distinct value was found
+        """
+        return len({c.value for c in self.candidates}) > 1
 
 
 class DataExtractor:
@@ -13,6 +82,7 @@ class DataExtractor:
         words (list[str]): A list of words
 
     Attributes:
+        FIELDS (tuple[str]): The names of the extracted fields
         BEFORE_GEMH_WORD (str): The word before the GEMH value
         BEFORE_DATE_WORD (str): The word before the date value
         BEFORE_WEBSITE_WORD (str): The word before the website value
@@ -29,14 +99,20 @@ class DataExtractor:
         WEBSITE_PATTERN (str): A pattern that is used to find website values
 
     Methods:
+        _keywords: Gets the keywords introducing the values
+        _keyword_ratio: Compares a word with a keyword
+        _match_keywords: Compares distinct words with every keyword
         _extract_website_values: Extracts the website values
         _extract_gemh_values: Extracts the GEMH values
         _extract_date_values: Extracts the date values
         _extract_name_values: Extracts the name values
-        _extract_data_from_file: Extracts the data from a file
-        _get_first_or_warn: Gets the first value from a set or warns
+        extract_many: Extracts the candidates of many texts at once
+        extract_results: Extracts the candidates of every field from a text
+        extract_results_from_file: Extracts the candidates from a file
+        extract_data_from_file: Extracts the data from a file
         _string_to_date: Converts a string to a date
     """
+    FIELDS: tuple[str, ...] = ('gemh', 'date', 'website', 'name')
     BEFORE_GEMH_WORD: str = 'ΓΕΜΗ'
     BEFORE_DATE_WORD: str = 'την'
     BEFORE_WEBSITE_WORD: str = 'ιστοσελιδασ'
@@ -55,18 +131,74 @@ class DataExtractor:
         r'[a-zA-Z0-9_-]*(?:\?[a-zA-Z0-9_=-]*)?'
     )
 
-    def _extract_website_values(self, words: list[str]) -> set[str]:
+    def _keywords(self) -> dict[str, tuple[str, Callable[[str], str], float]]:
+        """Gets the keywords introducing the values
+        :return: The keyword, the normalization of the compared words and
+            the ratio a word must exceed, by keyword name
+        """
+        return {
+            'website': (self.BEFORE_WEBSITE_WORD.lower().replace('ς', 'σ'),
+                        str.lower, 0.5),
+            'gemh': (self.BEFORE_GEMH_WORD,
+                     lambda word: word.replace('.', ''), 0.7),
+            'date': (self.BEFORE_DATE_WORD, str.lower, 0.5),
+            'after_date': (self.AFTER_DATE_WORD, str.lower, 0.5),
+            'name': (self.BEFORE_NAME_WORD, str.lower, 0.5),
+        }
+
+    @staticmethod
+    def _keyword_ratio(keyword: str, word: str,
+                       threshold: float) -> float | None:
+        """Compares a word with a keyword
+        :param keyword: The keyword
+        :param word: The normalized word
+        :param threshold: The ratio the word must exceed
+        :return: The match ratio or None if it does not exceed the threshold
+        """
+        # The ratio is 2 * matches / total length and at most the shorter
+        # word matches, so most words are rejected by their length alone
+        if 2.0 * min(len(keyword), len(word)) / (len(keyword) + len(word)) \
+                <= threshold:
+            return None
+        matcher = SequenceMatcher(None, keyword, word)
+        if matcher.quick_ratio() <= threshold:
+            return None
+        ratio = matcher.ratio()
+        return ratio if ratio > threshold else None
+
+    def _match_keywords(self, words: Iterable[str]
+                        ) -> dict[str, dict[str, float]]:
+        """Compares distinct words with every keyword
+        :param words: The distinct words
+        :return: The ratios of the matched keywords by word, words that
+            match no keyword are left out
+        """
+        keywords = self._keywords()
+        matches = {}
+        for word in words:
+            ratios = {}
+            for name, (keyword, normalize, threshold) in keywords.items():
+                ratio = self._keyword_ratio(keyword, normalize(word),
+                                            threshold)
+                if ratio is not None:
+                    ratios[name] = ratio
+            if ratios:
+                matches[word] = ratios
+        return matches
+
+    def _extract_website_values(self, words: list[str],
+                                hits: dict[int, dict[str, float]]
+                                ) -> list[Candidate]:
         """Extracts the website values
         :param words: A list of words
-        :return: The website values
-        """
-        website_values = set()
-        for index, word in enumerate(words):
-            ratio = SequenceMatcher(
-                None,
-                self.BEFORE_WEBSITE_WORD.lower().replace('ς', 'σ'),
-                word.lower()).ratio()
-            if ratio <= 0.5:
+        :param hits: The keyword ratios of the words matching a keyword by
+            position
+        :return: The website candidates
+        """
+        website_values = []
+        for index, ratios in hits.items():
+            ratio = ratios.get('website')
+            if ratio is None:
                 continue
 
             next_index = index + 1
@@ -77,22 +209,23 @@ class DataExtractor:
             if not re.match(self.WEBSITE_PATTERN, next_word):
                 continue
 
-            website_values.add(next_word)
+            website_values.append(Candidate(next_word, next_index, ratio))
 
         return website_values
 
-    def _extract_gemh_values(self, words: list[str]) -> set[int]:
+    def _extract_gemh_values(self, words: list[str],
+                             hits: dict[int, dict[str, float]]
+                             ) -> list[Candidate]:
         """Extracts the GEMH values
         :param words: A list of words
-        :return: The GEMH values
+        :param hits: The keyword ratios of the words matching a keyword by
+            position
+        :return: The GEMH candidates
         """
-        gemh_values = set()
-        for index, word in enumerate(words):
-            gemh_ratio = SequenceMatcher(None,
-                                         self.BEFORE_GEMH_WORD,
-                                         word.replace('.', '')).ratio()
-
-            if gemh_ratio <= 0.7:
+        gemh_values = []
+        for index, ratios in hits.items():
+            gemh_ratio = ratios.get('gemh')
+            if gemh_ratio is None:
                 continue
 
             next_index = index + 1
@@ -101,26 +234,29 @@ class DataExtractor:
 
             next_word = words[next_index]
             if re.match(self.GEMH_PATTERN, next_word):
-                next_word = re.sub('\W+', '', next_word)
-                gemh_values.add(int(next_word))
+                next_word = re.sub(r'\W+', '', next_word)
+                gemh_values.append(
+                    Candidate(int(next_word), next_index, gemh_ratio))
 
         return gemh_values
 
-    def _extract_date_values(self, words: list[str]) -> set[str]:
+    def _extract_date_values(self, words: list[str],
+                             hits: dict[int, dict[str, float]]
+                             ) -> list[Candidate]:
         """Extracts the date values
         :param words: A list of words
-        :return: The date values
-        """
-        date_values = set()
-        for index, word in enumerate(words):
-            before_date_word_ratio = SequenceMatcher(None,
-                                                     self.BEFORE_DATE_WORD,
-                                                     word.lower()).ratio()
-            if before_date_word_ratio <= 0.5:
+        :param hits: The keyword ratios of the words matching a keyword by
+            position
+        :return: The date candidates
+        """
+        date_values = []
+        for index, ratios in hits.items():
+            before_date_word_ratio = ratios.get('date')
+            if before_date_word_ratio is None:
                 continue
 
             next_index = index + 1
-            if next_index > len(words):
+            if next_index >= len(words):
                 continue
 
             next_word = words[next_index]
@@ -130,92 +266,108 @@ class DataExtractor:
             if next_index + 1 >= len(words):
                 continue
 
-            next_next_word = words[next_index + 1]
-            after_date_word_ratio = SequenceMatcher(
-                None,
-                self.AFTER_DATE_WORD,
-                next_next_word.lower()).ratio()
-            if after_date_word_ratio > 0.5:
+            after_date_word_ratio = hits.get(next_index + 1, {}).get(
+                'after_date')
+            if after_date_word_ratio is not None:
                 date_obj = self._string_to_date(next_word)
-                date_values.add(date_obj)
+                date_values.append(Candidate(
+                    date_obj, next_index,
+                    min(before_date_word_ratio, after_date_word_ratio)))
 
         return date_values
 
-    def _extract_name_values(self, words: list[str]) -> set[str]:
+    def _extract_name_values(self, words: list[str],
+                             hits: dict[int, dict[str, float]]
+                             ) -> list[Candidate]:
         """Extracts the name values
         :param words: A list of words
-        :return: The name values
-        """
-        name_values = set()
-        for index, word in enumerate(words):
-            before_name_word_ratio = SequenceMatcher(None,
-                                                     self.BEFORE_NAME_WORD,
-                                                     word.lower()).ratio()
-            if before_name_word_ratio <= 0.5:
+        :param hits: The keyword ratios of the words matching a keyword by
+            position
+        :return: The name candidates
+        """
+        name_values = []
+        for index, ratios in hits.items():
+            before_name_word_ratio = ratios.get('name')
+            if before_name_word_ratio is None:
                 continue
 
             name = []
             next_index = index + 1
-            while index < len(words):
+            while next_index < len(words):
                 next_word = words[next_index]
                 if (next_word.isupper() or next_word in self.NAME_SYMBOLS) \
                     and next_word not in self.NON_NAME_WORDS:
                     name.append(next_word)
                     next_index += 1
                     continue
-                elif name:
-                    name = ' '.join(name)
-                    for symbol in self.NON_NAME_SYMBOLS:
-                        name = name.replace(symbol, '')
-                    name_values.add(name)
                 break
 
+            if name:
+                name = ' '.join(name)
+                for symbol in self.NON_NAME_SYMBOLS:
+                    name = name.replace(symbol, '')
+                name_values.append(
+                    Candidate(name, index + 1, before_name_word_ratio))
+
         return name_values
 
+    def extract_many(self, texts: Iterable[str]
+                     ) -> list[dict[str, ExtractionResult]]:
+        """Extracts the candidates of every field from many texts at once
+
+        Every distinct word of the batch is compared with the keywords only
+        once, and the fields are only extracted at the positions of the
+        words that matched a keyword. Announcements share most of their
+        words, so larger batches do less work per document.
+        :param texts: The texts of the documents
+        :return: The extraction result of every field of every document, in
+            the order of the texts
+        """
+        documents = [text.split() for text in texts]
+        matches = self._match_keywords(
+            {word for words in documents for word in words})
+
+        results = []
+        for words in documents:
+            hits = {index: matches[word] for index, word in enumerate(words)
+                    if word in matches}
+            results.append({
+                'gemh': ExtractionResult(
+                    tuple(self._extract_gemh_values(words, hits))),
+                'date': ExtractionResult(
+                    tuple(self._extract_date_values(words, hits))),
+                'website': ExtractionResult(
+                    tuple(self._extract_website_values(words, hits))),
+                'name': ExtractionResult(
+                    tuple(self._extract_name_values(words, hits))),
+            })
+        return results
+
+    def extract_results(self, text: str) -> dict[str, ExtractionResult]:
+        """Extracts the candidates of every field from a text
+        :param text: The text of the document
+        :return: The extraction result of every field
+        """
+        return self.extract_many([text])[0]
+
+    def extract_results_from_file(self, filename: str
+                                  ) -> dict[str, ExtractionResult]:
+        """Extracts the candidates of every field from a file
+        :param filename: The file name
+        :return: The extraction result of every field
+        """
+        with open(filename, 'r') as f:
+            text = f.read()
+
+        return self.extract_results(text)
+
     def extract_data_from_file(self, filename: str) -> dict[str, str]:
         """Extracts the data from a file
         :param filename: The file name
         :return: The extracted data
         """
-        data = {}
-        with open(filename, 'r') as f:
-            text = f.read()
-            words = text.split()
-        
-        data = {
-            'gemh': self._get_first_or_warn(
-                self._extract_gemh_values(words),
-                f'Duplicate ΓΕΜΗ values found in {filename}',
-                f'No ΓΕΜΗ values found in {filename}'),
-            'date': self._get_first_or_warn(
-                self._extract_date_values(words),
-                f'Duplicate date values found in {filename}',
-                f'No date values found in {filename}'),
-            'website': self._get_first_or_warn(
-                self._extract_website_values(words),
-                f'Duplicate website values found in {filename}',
-                f'No website values found in {filename}'),
-            'name': self._get_first_or_warn(
-                self._extract_name_values(words),
-                f'Duplicate name values found in {filename}',
-                f'No name values found in {filename}')
-        }
-        
-        return data
-    
-    def _get_first_or_warn(self, values: set[str], duplicate_warning: str, no_values_warning: str) -> str:
-        """Gets the first value from a set or raises a warning
-        :param values: The set of values
-        :param duplicate_warning: The warning to raise if there are duplicate values
-        :param no_values_warning: The warning to raise if there are no values
-        :return: The first value
-        """
-        if len(values) > 1:
-            warn(duplicate_warning)
-        elif len(values) == 0:
-            warn(no_values_warning)
-            return ''
-        return next(iter(values))
+        results = self.extract_results_from_file(filename)
+        return {field: result.value for field, result in results.items()}
 
     def _string_to_date(self, date_str: str) -> datetime:
         """Converts a date string to a datetime object
@@ -230,41 +382,338 @@ class DataExtractor:
         raise ValueError(f'Unable to parse date string: {date_str}')
 
 
+class ExtractionSummary:
+    """Aggregates the extraction results of many documents
+
+    Attributes:
+        SAMPLE_SIZE (int): The number of file names kept per problem
+    """
+    SAMPLE_SIZE: int = 5
+
+    def __init__(self):
+        self.files = 0
+        self.missing = Counter()
+        self.ambiguous = Counter()
+        self.confidence = Counter()
+        self.samples = {}
+
+    def add(self, filename: str,
+            results: dict[str, ExtractionResult]) -> None:
+        """Adds the results of a document to the summary
+        :param filename: The name of the document
+        :param results: The extraction result of every field
+        """
+        self.files += 1
+        for field, result in results.items():
+            self.confidence[field] += result.confidence
+            if result.is_missing:
+                self._record(self.missing, ('missing', field), filename)
+            elif result.is_ambiguous:
+                self._record(self.ambiguous, ('ambiguous', field), filename)
+
+    def _record(self, counter: Counter, key: tuple[str, str],
+                filename: str) -> None:
+        """Counts a problem and keeps a sample of the affected files
+        :param counter: The counter of the problem
+        :param key: The problem and field name
+        :param filename: The name of the document
+        """
+        counter[key[1]] += 1
+        samples = self.samples.setdefault(key, [])
+        if len(samples) < self.SAMPLE_SIZE:
+            samples.append(filename)
+
+    def report(self) -> str:
+        """Formats the summary as a human readable report
+        :return: The report
+        """
+        lines = [f'Extraction summary for {self.files} files:']
+        for field in DataExtractor.FIELDS:
+            mean = self.confidence[field] / self.files if self.files else 0
+            lines.append(f'  {field}: {self.missing[field]} missing, '
+                         f'{self.ambiguous[field]} ambiguous, '
+                         f'mean confidence {mean:.2f}')
+        for (problem, field), samples in sorted(self.samples.items()):
+            lines.append(f'  {problem} {field}: {", ".join(samples)}')
+        return '\n'.join(lines)
+
+
+class Checkpoint:
+    """Records the documents that have been processed so that an
+    interrupted run can be resumed
+
+    The checkpoint is an append-only file with one document name per line,
+    so a crash can lose at most the line being written.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def load(self) -> set[str]:
+        """Loads the names of the processed documents
+        :return: The names of the processed documents
+        """
+        if not os.path.isfile(self.path):
+            return set()
+        with open(self.path, 'r') as f:
+            return {line.rstrip('\n') for line in f if line.strip()}
+
+    def reset(self) -> None:
+        """Forgets every processed document
+        """
+        self.close()
+        if os.path.isfile(self.path):
+            os.remove(self.path)
+
+    def mark(self, name: str) -> None:
+        """Marks a document as processed
+        :param name: The name of the document
+        """
+        if self._file is None:
+            self._file = open(self.path, 'a')
+        self._file.write(f'{name}\n')
+        self._file.flush()
+
+    def close(self) -> None:
+        """Closes the checkpoint file
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class DeadLetterQueue:
+    """Collects the documents that failed to be processed
+
+    Every failure is appended as a JSON line with the document name, the
+    error and its traceback.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.count = 0
+
+    def put(self, name: str, error: Exception) -> None:
+        """Records a failed document
+        :param name: The name of the document
+        :param error: The error that was raised
+        """
+        self.count += 1
+        entry = {
+            'file': name,
+            'error': repr(error),
+            'traceback': ''.join(traceback.format_exception(error)),
+            'time': datetime.utcnow().isoformat(),
+        }
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
 class FileProcessor:
     """Processes the text files
+
+    The files are read from a folder or streamed straight out of a zip or
+    tar (optionally compressed) archive without extracting it to disk.
+    Files are processed in name order, archive members in archive order.
+    Files listed in the checkpoint are skipped and files that raise are sent
+    to the dead-letter queue instead of aborting the run. Files are
+    extracted in batches of batch_size documents with
+    DataExtractor.extract_many.
     """
-    def __init__(self, folder: str='./txt'):
+    def __init__(self, folder: str='./txt',
+                 checkpoint: Checkpoint | None = None,
+                 dead_letter: DeadLetterQueue | None = None,
+                 batch_size: int = 100):
         self.folder = folder
+        self.batch_size = batch_size
         self.extractor = DataExtractor()
+        self.summary = ExtractionSummary()
+        self.checkpoint = checkpoint
+        self.dead_letter = dead_letter
+        self.skipped = 0
+
+    @property
+    def is_archive(self) -> bool:
+        """Whether the folder is a zip or tar archive
+        """
+        return os.path.isfile(self.folder) and (
+            zipfile.is_zipfile(self.folder) or tarfile.is_tarfile(self.folder))
 
-    def process_files(self):
-        """Processes the files
-        :return: The extracted data
+    @property
+    def is_valid(self) -> bool:
+        """Whether the folder is a folder or an archive
+        """
+        return os.path.isdir(self.folder) or self.is_archive
+
+    def list_files(self) -> list[str]:
+        """Lists the text files of the folder or archive in processing order
+        :return: The file names
+        """
+        if not self.is_archive:
+            return [filename for filename in sorted(os.listdir(self.folder))
+                    if filename.endswith('.txt')
+                    and os.path.isfile(os.path.join(self.folder, filename))]
+
+        if zipfile.is_zipfile(self.folder):
+            with zipfile.ZipFile(self.folder) as archive:
+                return sorted(info.filename for info in archive.infolist()
+                              if self._is_text_member(info.filename,
+                                                      not info.is_dir()))
+
+        with tarfile.open(self.folder, 'r|*') as archive:
+            return [member.name for member in archive
+                    if self._is_text_member(member.name, member.isfile())]
+
+    def iter_files(self) -> Iterator[tuple[str, dict[str, any]]]:
+        """Extracts the data of every file lazily
+        :return: An iterator of file names and extracted data
         """
-        if not os.path.isdir(self.folder):
-            print(f'Error: {self.folder} is not a valid folder.')
+        if not self.is_valid:
+            print(f'Error: {self.folder} is not a valid folder or archive.')
             return
 
-        files_count = 0
-        results = []
+        if not self.is_archive:
+            yield from self.iter_documents(
+                (filename, partial(self._read_file, filename))
+                for filename in self.list_files())
+        elif zipfile.is_zipfile(self.folder):
+            with zipfile.ZipFile(self.folder) as archive:
+                yield from self.iter_documents(
+                    (name, partial(self._read_member, archive.open, name))
+                    for name in self.list_files())
+        else:
+            # Stream mode reads the archive sequentially, so every member
+            # must be read before the next one is requested
+            with tarfile.open(self.folder, 'r|*') as archive:
+                yield from self.iter_documents(
+                    (member.name,
+                     partial(self._read_member, archive.extractfile, member))
+                    for member in archive
+                    if self._is_text_member(member.name, member.isfile()))
+
+    def iter_documents(self, documents: Iterable[tuple[str, Callable[[], str]]]
+                       ) -> Iterator[tuple[str, dict[str, any]]]:
+        """Extracts the data of every document lazily
+        :param documents: The names of the documents and the functions
+            that read them
+        :return: An iterator of document names and extracted data
+        """
+        done = self.checkpoint.load() if self.checkpoint else set()
 
-        for filename in os.listdir(self.folder):
-            if not filename.endswith('.txt'):
+        batch = []
+        for name, read in documents:
+            if name in done:
+                self.skipped += 1
                 continue
 
-            file_path = os.path.join(self.folder, filename)
-            if not os.path.isfile(file_path):
+            # Read right away, archive streams cannot go back to a member
+            try:
+                batch.append((name, read(), None))
+            except Exception as e:
+                batch.append((name, None, e))
+
+            if len(batch) >= self.batch_size:
+                yield from self._extract_batch(batch)
+                batch = []
+
+        if batch:
+            yield from self._extract_batch(batch)
+
+    def _extract_batch(self, batch: list[tuple[str, str | None,
+                                               Exception | None]]
+                       ) -> Iterator[tuple[str, dict[str, any]]]:
+        """Extracts the data of a batch of documents
+
+        The documents are extracted one at a time if the batch fails, so
+        only the failing documents are lost. Failures are recorded in
+        document order, after the data of the previous documents has been
+        consumed.
+        :param batch: The names, texts and read errors of the documents
+        :return: An iterator of document names and extracted data
+        """
+        texts = [text for _, text, error in batch if error is None]
+        try:
+            extractions = iter(self.extractor.extract_many(texts))
+        except Exception:
+            extractions = None
+
+        for name, text, error in batch:
+            extraction = None
+            if error is None and extractions is not None:
+                extraction = next(extractions)
+            elif error is None:
+                try:
+                    extraction = self.extractor.extract_results(text)
+                except Exception as e:
+                    error = e
+
+            if error is not None:
+                if self.dead_letter is None:
+                    raise error
+                self.dead_letter.put(name, error)
+                if self.checkpoint:
+                    self.checkpoint.mark(name)
                 continue
 
-            files_count += 1
-            data = self.extractor.extract_data_from_file(file_path)
+            self.summary.add(name, extraction)
+            yield name, {field: result.value
+                         for field, result in extraction.items()}
+
+    def _read_file(self, filename: str) -> str:
+        """Reads a file of the folder
+        :param filename: The file name
+        :return: The text of the file
+        """
+        with open(os.path.join(self.folder, filename), 'r') as f:
+            return f.read()
+
+    @staticmethod
+    def _read_member(open_member: Callable[[any], IO[bytes]],
+                     member: any) -> str:
+        """Reads a member of an archive
+        :param open_member: The function that opens the member
+        :param member: The member or its name
+        :return: The text of the member
+        """
+        with open_member(member) as f:
+            return f.read().decode('utf-8')
+
+    @staticmethod
+    def _is_text_member(name: str, is_file: bool) -> bool:
+        """Checks if an archive member is a text file
+        :param name: The name of the member
+        :param is_file: Whether the member is a regular file
+        :return: True if the member should be processed
+        """
+        return is_file and name.endswith('.txt') \
+            and not os.path.basename(name).startswith('.')
+
+    def process_files(self):
+        """Processes the files
+        :return: The extracted data
+        """
+        if not self.is_valid:
+            print(f'Error: {self.folder} is not a valid folder or archive.')
+            return
+
+        results = []
+        for filename, data in self.iter_files():
             if data:
                 results.append(data)
+            if self.checkpoint:
+                self.checkpoint.mark(filename)
 
-        print(f'Processed {files_count} files,'
-              f'extracted data from {len(results)} files')
+        self.print_report()
         return results
 
+    def print_report(self) -> None:
+        """Prints the summary of the processed files
+        """
+        failed = self.dead_letter.count if self.dead_letter else 0
+        print(f'Processed {self.summary.files + failed} files, '
+              f'extracted data from {self.summary.files} files, '
+              f'{failed} failed, {self.skipped} skipped from checkpoint')
+        print(self.summary.report())
+
 
 def main():
     fp = FileProcessor()
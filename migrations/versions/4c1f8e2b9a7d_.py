@@ -0,0 +1,249 @@
+"""Store GEMH as BIGINT and add normalized domain and name columns
+
+Revision ID: 4c1f8e2b9a7d
+Revises: 803ca12a50c0
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+import logging
+import re
+import unicodedata
+from contextlib import contextmanager
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+# revision identifiers, used by Alembic.
+revision = '4c1f8e2b9a7d'
+down_revision = '803ca12a50c0'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.env')
+
+# Rows updated per transaction while backfilling, small enough to keep the
+# row locks short on a live table
+BATCH_SIZE = 1000
+
+# Copies of the normalization in api.models at the time of this revision,
+# so the migration neither starts the app nor follows later model changes
+SCHEME_PATTERN = re.compile(r'^[a-z][a-z0-9+.-]*://')
+NAME_SEPARATOR_PATTERN = re.compile(r'[\W_]+')
+# GEMH numbers that fit in a BIGINT
+GEMH_PATTERN = re.compile(r'[0-9]{1,18}')
+
+company = sa.table(
+    'company',
+    sa.column('id', sa.Integer),
+    sa.column('name', sa.String),
+    sa.column('gemh'),
+    sa.column('gemh_swap'),
+    sa.column('website', sa.String),
+    sa.column('domain', sa.String),
+    sa.column('normalized_name', sa.String),
+)
+
+
+def normalize_domain(website):
+    """Reduces a website to its lowercase domain without the scheme, the
+    www. prefix and the path
+    """
+    if not website:
+        return None
+    domain = SCHEME_PATTERN.sub('', website.strip().lower())
+    domain = re.split(r'[/?#]', domain, maxsplit=1)[0].strip('.')
+    if domain.startswith('www.'):
+        domain = domain[4:]
+    return domain[:128] or None
+
+
+def normalize_name(name):
+    """Reduces a name to casefolded words without accents and punctuation
+    """
+    if not name:
+        return None
+    name = unicodedata.normalize('NFKD', name.casefold())
+    name = ''.join(c for c in name if not unicodedata.combining(c))
+    return ' '.join(NAME_SEPARATOR_PATTERN.sub(' ', name).split())[:255] \
+        or None
+
+
+def backfill(values):
+    """Updates the rows whose new column values are out of date in batches
+    of BATCH_SIZE rows, committing after every batch outside a transaction
+    :param values: Function making the new column values of a row
+    """
+    connection = op.get_bind()
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select(company)
+            .where(company.c.id > last_id)
+            .order_by(company.c.id)
+            .limit(BATCH_SIZE)).all()
+        if not rows:
+            return
+
+        changed = [(row, row_values) for row, row_values in
+                   ((row, values(row)) for row in rows)
+                   if any(getattr(row, column) != value
+                          for column, value in row_values.items())]
+        if changed:
+            connection.execute(
+                company.update()
+                .where(company.c.id == sa.bindparam('row_id'))
+                .values({column: sa.bindparam(f'row_{column}')
+                         for column in changed[0][1]}),
+                [{'row_id': row.id,
+                  **{f'row_{column}': value
+                     for column, value in row_values.items()}}
+                 for row, row_values in changed])
+        last_id = rows[-1].id
+
+
+@contextmanager
+def writes_blocked():
+    """Blocks writes to the company table, so none lands between the last
+    backfill pass and the swap of the gemh columns
+    """
+    if op.get_bind().dialect.name == 'mysql':
+        with op.get_context().autocommit_block():
+            op.execute('LOCK TABLES company WRITE')
+            try:
+                yield
+            finally:
+                op.execute('UNLOCK TABLES')
+    else:
+        # SQLite keeps other writers out from the first write of the
+        # migration's transaction until it commits
+        op.execute(company.update().where(sa.false())
+                   .values(gemh_swap=company.c.gemh_swap))
+        yield
+
+
+def clear_duplicates():
+    """Clears the gemh_swap values repeating the value of a row with a lower
+    id, such as '0123' after '123', so the unique index can be built
+    :return: The ids and old GEMH numbers of the cleared rows
+    """
+    connection = op.get_bind()
+    duplicated = connection.execute(
+        sa.select(company.c.gemh_swap)
+        .where(company.c.gemh_swap.isnot(None))
+        .group_by(company.c.gemh_swap)
+        .having(sa.func.count() > 1)).scalars().all()
+    if not duplicated:
+        return []
+
+    seen = set()
+    cleared = []
+    for row in connection.execute(
+            sa.select(company.c.id, company.c.gemh, company.c.gemh_swap)
+            .where(company.c.gemh_swap.in_(duplicated))
+            .order_by(company.c.gemh_swap, company.c.id)):
+        if row.gemh_swap in seen:
+            cleared.append((row.id, row.gemh))
+        seen.add(row.gemh_swap)
+    connection.execute(
+        company.update()
+        .where(company.c.id.in_([row_id for row_id, _ in cleared]))
+        .values(gemh_swap=None))
+    return cleared
+
+
+def swap_gemh(type_):
+    """Replaces the gemh column with the backfilled gemh_swap column, which
+    only renames a column instead of copying the table like changing the
+    type in place does on MySQL
+    :param type_: The type of the gemh_swap column
+    """
+    if op.get_bind().dialect.name == 'mysql':
+        # A single statement, since the table lock may be released after
+        # every ALTER TABLE
+        op.execute('ALTER TABLE company DROP INDEX ix_company_gemh, '
+                   'DROP COLUMN gemh, RENAME COLUMN gemh_swap TO gemh, '
+                   'ADD UNIQUE INDEX ix_company_gemh (gemh)')
+        return
+
+    with op.batch_alter_table('company', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_company_gemh'))
+        batch_op.drop_column('gemh')
+        batch_op.alter_column('gemh_swap', new_column_name='gemh',
+                              existing_type=type_, existing_nullable=True)
+    with op.batch_alter_table('company', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_company_gemh'), ['gemh'],
+                              unique=True)
+
+
+def log_cleared(reason, cleared):
+    """Logs the GEMH numbers that were cleared
+    :param reason: Why the numbers were cleared
+    :param cleared: The ids and old GEMH numbers of the cleared rows
+    """
+    if cleared:
+        logger.warning('Cleared %d GEMH values that %s, company ids and '
+                       'numbers %s%s', len(cleared), reason,
+                       ', '.join(f'{row_id}={gemh}'
+                                 for row_id, gemh in cleared[:100]),
+                       ', ...' if len(cleared) > 100 else '')
+
+
+def upgrade():
+    with op.batch_alter_table('company', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('domain', sa.String(length=128),
+                                      nullable=True))
+        batch_op.add_column(sa.Column('normalized_name',
+                                      sa.String(length=255), nullable=True))
+        batch_op.add_column(sa.Column('gemh_swap', sa.BigInteger(),
+                                      nullable=True))
+        batch_op.create_index(batch_op.f('ix_company_domain'), ['domain'],
+                              unique=False)
+        batch_op.create_index(batch_op.f('ix_company_normalized_name'),
+                              ['normalized_name'], unique=False)
+
+    cleared = {}
+
+    def values(row):
+        gemh = str(row.gemh) if row.gemh is not None else ''
+        numeric = GEMH_PATTERN.fullmatch(gemh) is not None
+        if gemh and not numeric:
+            cleared[row.id] = row.gemh
+        else:
+            cleared.pop(row.id, None)
+        return {'domain': normalize_domain(row.website),
+                'normalized_name': normalize_name(row.name),
+                'gemh_swap': int(gemh) if numeric else None}
+
+    with op.get_context().autocommit_block():
+        backfill(values)
+    with writes_blocked():
+        # Rows written while the first pass ran, the rows that are up to
+        # date are only read
+        backfill(values)
+        duplicates = clear_duplicates()
+        swap_gemh(sa.BigInteger())
+
+    log_cleared('are not numbers', sorted(cleared.items()))
+    log_cleared('repeat the number of another company', duplicates)
+
+
+def downgrade():
+    with op.batch_alter_table('company', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('gemh_swap', mysql.VARCHAR(length=64),
+                                      nullable=True))
+
+    def values(row):
+        return {'gemh_swap': str(row.gemh) if row.gemh is not None
+                else None}
+
+    with op.get_context().autocommit_block():
+        backfill(values)
+    with writes_blocked():
+        backfill(values)
+        swap_gemh(mysql.VARCHAR(length=64))
+
+    with op.batch_alter_table('company', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_company_normalized_name'))
+        batch_op.drop_index(batch_op.f('ix_company_domain'))
+        batch_op.drop_column('normalized_name')
+        batch_op.drop_column('domain')
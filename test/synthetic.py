@@ -0,0 +1,238 @@
+import os
+import random
+import re
+from datetime import datetime, timedelta
+
+from data_extractor import DataExtractor
+
+TEMPLATE_FOLDER: str = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'txt')
+
+SURNAMES: tuple[str, ...] = (
+    'ΠΑΠΑΔΟΠΟΥΛΟΣ', 'ΓΕΩΡΓΙΟΥ', 'ΝΙΚΟΛΑΟΥ', 'ΚΩΝΣΤΑΝΤΙΝΙΔΗΣ', 'ΙΩΑΝΝΟΥ',
+    'ΑΘΑΝΑΣΙΟΥ', 'ΔΗΜΗΤΡΙΟΥ', 'ΜΑΡΑΤΟΣ', 'ΛΕΥΚΟΦΡΥΔΟΥ', 'ΑΜΠΑΤΖΗΣ',
+    'ΜΠΟΥΤΛΑΣ', 'ΚΑΡΑΓΙΑΝΝΗΣ', 'ΒΛΑΧΟΣ', 'ΣΤΑΥΡΟΠΟΥΛΟΥ', 'ΜΙΧΑΗΛΙΔΗΣ',
+    'ΞΕΝΑΚΗΣ', 'ΘΕΟΔΩΡΟΥ', 'ΧΑΤΖΗΣ', 'ΨΑΡΡΑΣ', 'ΖΑΦΕΙΡΙΟΥ')
+ACTIVITIES: tuple[str, ...] = (
+    'ΕΜΠΟΡΙΚΗ', 'ΤΕΧΝΙΚΗ', 'ΤΟΥΡΙΣΤΙΚΗ', 'ΚΑΤΑΣΚΕΥΑΣΤΙΚΗ', 'ΧΗΜΙΚΗ',
+    'ΕΙΣΑΓΩΓΕΣ - ΕΞΑΓΩΓΕΣ', 'ΣΥΜΒΟΥΛΕΥΤΙΚΗ', 'ΜΗΧΑΝΟΡΓΑΝΩΤΙΚΗ')
+LEGAL_FORMS: tuple[str, ...] = (
+    'ΙΚΕ', 'Ε.Π.Ε.', 'Ο.Ε.', 'Ε.Ε.', 'Α.Ε.', 'ΑΝΩΝΥΜΗ ΕΤΑΙΡΕΙΑ',
+    'ΙΔΙΩΤΙΚΗ ΚΕΦΑΛΑΙΟΥΧΙΚΗ ΕΤΑΙΡΕΙΑ', 'ΕΤΑΙΡΕΙΑ ΠΕΡΙΟΡΙΣΜΕΝΗΣ ΕΥΘΥΝΗΣ')
+GREEK_TO_LATIN: dict[int, str] = str.maketrans({
+    'Α': 'a', 'Β': 'v', 'Γ': 'g', 'Δ': 'd', 'Ε': 'e', 'Ζ': 'z', 'Η': 'i',
+    'Θ': 'th', 'Ι': 'i', 'Κ': 'k', 'Λ': 'l', 'Μ': 'm', 'Ν': 'n', 'Ξ': 'x',
+    'Ο': 'o', 'Π': 'p', 'Ρ': 'r', 'Σ': 's', 'Τ': 't', 'Υ': 'y', 'Φ': 'f',
+    'Χ': 'ch', 'Ψ': 'ps', 'Ω': 'o'})
+TOP_LEVEL_DOMAINS: tuple[str, ...] = ('gr', 'com', 'eu', 'com.gr')
+DATE_FORMATS: tuple[str, ...] = ('%d/%m/%Y', '%d-%m-%Y')
+
+# The font mapping damage seen in the registry PDFs: the header paragraph
+# of older announcements is shifted by one letter, the body of some
+# announcements swaps a few letters
+HEAVY_DAMAGE: dict[int, int] = str.maketrans('ΕΖΗΙΣΤΥΧΩ', 'ΔΕΖΗ΢ΣΤΥΧ')
+LIGHT_DAMAGE: dict[int, int] = str.maketrans('ΖΗΣΤΥσς', 'ΗΘ΢ΣΤςσ')
+
+NOISE_LINES: tuple[str, ...] = (
+    'Σελίδα {page} από {pages}',
+    'Τηλ: 210 {number} Fax: 210 {number}',
+    'Απιθ. Ππωη. : {number}',
+    '{number} {number} {number}',
+    '________________________________',
+)
+
+
+class AnnouncementGenerator:
+    """Builds realistic announcements with known values from the txt/
+    templates
+
+    The values of every template are found with the extractor and replaced
+    by random names, GEMH numbers, registration dates and websites. Some
+    documents get their prose damaged like the registry PDFs and noise
+    lines between paragraphs.
+
+    Args:
+        folder (str): The folder of the templates
+        seed (int): The seed of the random generator
+        damage_rate (float): The share of documents with damaged prose
+        noise_rate (float): The chance of a noise line on every blank line
+    """
+    def __init__(self, folder: str = TEMPLATE_FOLDER, seed: int = 0,
+                 damage_rate: float = 0.2, noise_rate: float = 0.1):
+        self.random = random.Random(seed)
+        self.damage_rate = damage_rate
+        self.noise_rate = noise_rate
+        self.templates = [
+            self._template(os.path.join(folder, filename))
+            for filename in sorted(os.listdir(folder))
+            if filename.endswith('.txt')]
+        self._used = set()
+
+    @staticmethod
+    def _template(path: str) -> str:
+        """Replaces the values of an announcement with placeholders
+        :param path: The path of the announcement
+        :return: The template, formatted with str.format
+        """
+        with open(path, 'r') as f:
+            text = f.read().replace('{', '{{').replace('}', '}}')
+
+        results = DataExtractor().extract_results(text)
+        tokens = re.split(r'(\s+)', text)
+        if tokens and not tokens[0]:
+            tokens = tokens[2:]
+        # Words are at the even indexes, the whitespace after them at the
+        # odd ones
+        words = tokens[::2]
+
+        # Every occurrence of the number, the damaged header repeats it
+        # without a keyword the extractor recognizes
+        for gemh in {candidate.value
+                     for candidate in results['gemh'].candidates}:
+            words = [re.sub(rf'(?<!\d)0*{gemh}(?!\d)', '{gemh}', word)
+                     for word in words]
+        for candidate in results['date'].candidates:
+            date = words[candidate.position]
+            words = [word.replace(date, '{date}') for word in words]
+        for candidate in results['website'].candidates:
+            words[candidate.position] = '{website}'
+
+        name = results['name'].value
+        for candidate in results['name'].candidates:
+            end = candidate.position
+            while end < len(words) and (
+                    words[end].isupper()
+                    or words[end] in DataExtractor.NAME_SYMBOLS) \
+                    and words[end] not in DataExtractor.NON_NAME_WORDS:
+                end += 1
+            words[candidate.position] = '{name}' if candidate.value == name \
+                else '{damaged_name}'
+            for index in range(candidate.position + 1, end):
+                words[index] = None
+
+        parts = []
+        for index, word in enumerate(words):
+            if word is not None:
+                parts.append(word)
+                parts.append(tokens[index * 2 + 1]
+                             if index * 2 + 1 < len(tokens) else '')
+        template = ''.join(parts)
+        if not results['website'].candidates:
+            template = template.replace('{website}', '')
+        return template
+
+    def generate(self) -> tuple[str, dict[str, any]]:
+        """Generates an announcement
+        :return: The text and the values it holds, in the format of
+            DataExtractor.extract_data_from_file
+        """
+        template = self.random.choice(self.templates)
+        if self.random.random() < self.damage_rate:
+            template = template.translate(LIGHT_DAMAGE)
+
+        values = {
+            'gemh': self._unique(lambda: self.random.randrange(
+                10 ** 8, 10 ** 12)),
+            'date': datetime(2011, 1, 1) + timedelta(
+                days=self.random.randrange(365 * 12)),
+            'name': self._unique(self._name),
+        }
+        values['website'] = self._unique(
+            lambda: self._website(values['name'])) \
+            if '{website}' in template else ''
+
+        text = template.format(
+            gemh=values['gemh'],
+            date=values['date'].strftime(self.random.choice(DATE_FORMATS)),
+            website=values['website'],
+            name=values['name'],
+            damaged_name=values['name'].translate(HEAVY_DAMAGE))
+        return self._add_noise(text), values
+
+    def write(self, folder: str, count: int) -> dict[str, dict[str, any]]:
+        """Writes announcements to a folder
+        :param folder: The folder
+        :param count: The number of announcements
+        :return: The values of every announcement by file name
+        """
+        os.makedirs(folder, exist_ok=True)
+        expected = {}
+        for index in range(count):
+            text, values = self.generate()
+            filename = f'synthetic_{index:07d}.txt'
+            with open(os.path.join(folder, filename), 'w') as f:
+                f.write(text)
+            expected[filename] = values
+        return expected
+
+    def _unique(self, make) -> any:
+        """Makes values until one has not been used by another document,
+        names, websites and GEMH numbers are unique in the database
+        :param make: The function making a value
+        :return: The value
+        """
+        value = make()
+        while value in self._used:
+            value = make()
+        self._used.add(value)
+        return value
+
+    def _name(self) -> str:
+        """Makes a company name
+        :return: The name
+        """
+        choice = self.random.choice
+        surname = choice(SURNAMES)
+        style = self.random.randrange(4)
+        if style == 0:
+            name = f'{choice("ΑΓΔΚΜΝΠΣ")}. {surname}'
+        elif style == 1:
+            name = f'{surname} - {choice(SURNAMES)}'
+        elif style == 2:
+            name = f'{surname} & ΣΙΑ'
+        else:
+            name = f'{choice(ACTIVITIES)} {surname}'
+        return f'{name} {choice(LEGAL_FORMS)}'
+
+    def _website(self, name: str) -> str:
+        """Makes the website of a company
+        :param name: The name of the company
+        :return: The website
+        """
+        slug = '-'.join(word.translate(GREEK_TO_LATIN)
+                        for word in name.split()[:2] if word.isalpha())
+        prefix = self.random.choice(('www.', 'www.', 'http://www.', ''))
+        return f'{prefix}{slug or "company"}{self.random.randrange(1000)}.' \
+               f'{self.random.choice(TOP_LEVEL_DOMAINS)}'
+
+    def _add_noise(self, text: str) -> str:
+        """Adds noise lines on some blank lines, never inside a paragraph
+        so the values stay next to their keywords
+        :param text: The text
+        :return: The text with noise
+        """
+        lines = []
+        for line in text.split('\n'):
+            lines.append(line)
+            if not line.strip() and self.random.random() < self.noise_rate:
+                lines.append(self.random.choice(NOISE_LINES).format(
+                    page=self.random.randint(1, 3),
+                    pages=3,
+                    number=self.random.randrange(10 ** 6, 10 ** 7)))
+        return '\n'.join(lines)
+
+
+def accuracy(expected: dict[str, dict[str, any]],
+             extracted: dict[str, dict[str, any]]) -> float:
+    """Computes the share of values extracted correctly
+    :param expected: The values of every document by name
+    :param extracted: The extracted values of every document by name
+    :return: The share of correct values
+    """
+    total = correct = 0
+    for name, values in expected.items():
+        found = extracted.get(name, {})
+        for field, value in values.items():
+            total += 1
+            correct += found.get(field) == value
+    return correct / total if total else 1.0
@@ -0,0 +1,129 @@
+import os
+import pytest
+import resource
+import sys
+from flask import Flask
+from typing import Generator
+
+from api.app import create_app
+from api.models import Company
+from config import config
+from data_extractor import FileProcessor
+from test.synthetic import AnnouncementGenerator, accuracy
+
+# Only run on request, timings on a busy host must not fail flask test
+pytestmark = pytest.mark.skipif(os.environ.get('BENCHMARKS') != 'true',
+                                reason='Set BENCHMARKS=true to run')
+
+# Corpus sizes and regression thresholds, raise the sizes to measure scaling.
+# Throughput regressions are caught by comparing with a saved run with
+# --benchmark-compare-fail, MIN_FILES_PER_SEC is an optional absolute floor
+SIZES: list[int] = [int(size) for size in
+                    os.environ.get('BENCHMARK_SIZES', '50,200').split(',')]
+ROUNDS: int = int(os.environ.get('BENCHMARK_ROUNDS', 1))
+MIN_FILES_PER_SEC: float | None = (
+    float(os.environ['BENCHMARK_MIN_FILES_PER_SEC'])
+    if os.environ.get('BENCHMARK_MIN_FILES_PER_SEC') else None)
+MAX_RSS_MB: float = float(os.environ.get('BENCHMARK_MAX_RSS_MB', 1024))
+MIN_ACCURACY: float = float(os.environ.get('BENCHMARK_MIN_ACCURACY', 0.9))
+
+
+def peak_rss_mb() -> float:
+    """Get the peak resident set size of the test process
+    :return: The peak RSS in MB
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak / 1024 ** 2 if sys.platform == 'darwin' else peak / 1024
+
+
+def check_performance(benchmark, size: int, score: float) -> None:
+    """Record the throughput, peak RSS and accuracy of a run and fail on
+    regressions.
+    :param benchmark: The benchmark fixture
+    :param size: The number of files
+    :param score: The share of values extracted correctly
+    """
+    benchmark.extra_info['accuracy'] = score
+    benchmark.extra_info['peak_rss_mb'] = peak_rss_mb()
+    assert score >= MIN_ACCURACY
+    assert benchmark.extra_info['peak_rss_mb'] <= MAX_RSS_MB
+
+    # Timings are missing when benchmarks are disabled
+    if benchmark.stats is None:
+        return
+    files_per_sec = size / benchmark.stats.stats.mean
+    benchmark.extra_info['files_per_sec'] = files_per_sec
+    if MIN_FILES_PER_SEC is not None:
+        assert files_per_sec >= MIN_FILES_PER_SEC
+
+
+@pytest.fixture(scope='module', params=SIZES, ids=lambda size: f'{size}')
+def corpus(request, tmp_path_factory) -> tuple[str, int, dict]:
+    """Generate a synthetic corpus for each size.
+    :return: The folder, the number of files and the expected values
+    """
+    folder = str(tmp_path_factory.mktemp(f'corpus_{request.param}'))
+    expected = AnnouncementGenerator(seed=request.param).write(
+        folder, request.param)
+    return folder, request.param, expected
+
+
+@pytest.fixture
+def sqlite_app(tmp_path, monkeypatch) -> Generator[Flask, None, None]:
+    """Create an app with a local SQLite database.
+    """
+    monkeypatch.setattr(config['testing'], 'SQLALCHEMY_DATABASE_URI',
+                        f'sqlite:///{tmp_path / "benchmark.sqlite3"}')
+    monkeypatch.setattr(config['testing'], 'SQLALCHEMY_BINDS', {})
+    monkeypatch.setattr(config['testing'], 'REPLICA_BINDS', [])
+    app = create_app('testing')
+    with app.app_context():
+        yield app
+
+
+def test_file_processor_throughput(benchmark, corpus) -> None:
+    """Test the throughput and accuracy of FileProcessor on synthetic
+    announcements.
+    """
+    folder, size, expected = corpus
+
+    extracted = benchmark.pedantic(
+        lambda: dict(FileProcessor(folder).iter_files()),
+        rounds=ROUNDS, iterations=1)
+
+    check_performance(benchmark, size, accuracy(expected, extracted))
+
+
+def test_flask_extract_throughput(benchmark, corpus, sqlite_app,
+                                  tmp_path) -> None:
+    """Test the throughput and accuracy of flask extract inserting
+    synthetic announcements into SQLite.
+    """
+    folder, size, expected = corpus
+    db = sqlite_app.extensions['sqlalchemy']
+    runner = sqlite_app.test_cli_runner()
+
+    def reset() -> None:
+        db.drop_all()
+        db.create_all()
+
+    def extract() -> None:
+        result = runner.invoke(args=[
+            'extract', '--folder', folder,
+            '--checkpoint', str(tmp_path / 'extract.checkpoint'),
+            '--dead-letter', str(tmp_path / 'extract.deadletter.jsonl')])
+        assert result.exit_code == 0, result.output
+
+    benchmark.pedantic(extract, setup=reset, rounds=ROUNDS, iterations=1)
+
+    companies = {company.gemh: company for company in Company.query}
+    extracted = {}
+    for filename, values in expected.items():
+        company = companies.get(values['gemh'])
+        if company is not None:
+            extracted[filename] = {'gemh': company.gemh,
+                                   'date': company.registration_date,
+                                   'website': company.website or '',
+                                   'name': company.name}
+    check_performance(benchmark, size, accuracy(expected, extracted))
@@ -1,5 +1,12 @@
+import json
 import os
-from data_extractor import DataExtractor
+import pytest
+import tarfile
+import zipfile
+from datetime import datetime
+from io import BytesIO
+from data_extractor import (Checkpoint, DataExtractor, DeadLetterQueue,
+                            ExtractionSummary, FileProcessor)
 
 
 def test_extract_data_from_file() -> None:
@@ -20,3 +27,160 @@ def test_extract_data_from_file() -> None:
     assert data['website'] == 'https://www.example.com'
 
     os.remove(filename)
+
+
+def test_extract_results_chooses_deterministically() -> None:
+    de = DataExtractor()
+
+    results = de.extract_results('ΓΕΜΗ 222222\n'
+                                 'ΓΕΜΗ 111111\n'
+                                 'Γ.Ε.ΜΗ. 333333\n')
+
+    assert results['gemh'].is_ambiguous
+    assert [c.value for c in results['gemh'].candidates] == \
+        [222222, 111111, 333333]
+    assert [c.position for c in results['gemh'].candidates] == [1, 3, 5]
+    assert results['gemh'].value == 222222
+    assert results['gemh'].confidence == 1.0
+
+
+def test_extract_results_missing_values() -> None:
+    de = DataExtractor()
+
+    results = de.extract_results('ΓΕΜΗ 123456\n')
+
+    assert not results['gemh'].is_missing
+    assert results['website'].is_missing
+    assert results['website'].value == ''
+    assert results['website'].confidence == 0.0
+
+
+def test_extraction_summary_report() -> None:
+    de = DataExtractor()
+    summary = ExtractionSummary()
+
+    summary.add('a.txt', de.extract_results('ΓΕΜΗ 1 ΓΕΜΗ 2'))
+    summary.add('b.txt', de.extract_results('ΓΕΜΗ 1'))
+
+    assert summary.files == 2
+    assert summary.ambiguous['gemh'] == 1
+    assert summary.missing['website'] == 2
+    assert 'ambiguous gemh: a.txt' in summary.report()
+
+
+def test_extract_name_at_end_of_text() -> None:
+    de = DataExtractor()
+
+    results = de.extract_results('ΕΠΩΝΥΜΙΑ TEST COMPANY')
+
+    assert results['name'].value == 'TEST COMPANY'
+
+
+def test_extract_many_matches_recorded_candidates() -> None:
+    """Test that batch and single document extraction find the candidates
+    recorded from the original word by word extractor, for the txt/
+    samples and texts with damaged keywords around the match thresholds.
+    """
+    de = DataExtractor()
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    with open(os.path.join(root, 'test', 'expected_candidates.json')) as f:
+        recorded = json.load(f)
+    assert sorted(recorded['txt']) == \
+        sorted(os.listdir(os.path.join(root, 'txt')))
+
+    texts = []
+    for filename in recorded['txt']:
+        with open(os.path.join(root, 'txt', filename)) as f:
+            texts.append(f.read())
+    texts += recorded['texts']
+    expected = [*recorded['txt'].values(), *recorded['texts'].values()]
+
+    def candidates(results: dict) -> dict:
+        return {field: [[value.isoformat() if isinstance(value, datetime)
+                         else value, position, confidence]
+                        for value, position, confidence in result.candidates]
+                for field, result in results.items()}
+
+    assert [candidates(results) for results in de.extract_many(texts)] == \
+        expected
+    assert [candidates(de.extract_results(text)) for text in texts] == \
+        expected
+
+
+def test_file_processor_batch_failure(tmp_path) -> None:
+    folder = tmp_path / 'txt'
+    folder.mkdir()
+    (folder / 'a.txt').write_text('ΓΕΜΗ 111111\n')
+    (folder / 'b.txt').write_text('ΓΕΜΗ 22a\n')
+    (folder / 'c.txt').write_text('ΓΕΜΗ 333333\n')
+
+    dead_letter = DeadLetterQueue(str(tmp_path / 'dead_letter.jsonl'))
+    fp = FileProcessor(folder=str(folder), dead_letter=dead_letter)
+
+    assert [data['gemh'] for data in fp.process_files()] == \
+        [111111, 333333]
+    assert dead_letter.count == 1
+
+
+def test_file_processor_dead_letter_and_resume(tmp_path) -> None:
+    folder = tmp_path / 'txt'
+    folder.mkdir()
+    (folder / 'a.txt').write_text('ΓΕΜΗ 111111\n')
+    (folder / 'b.txt').write_text('την 99/99/2022 καταχωρηθηκε\n')
+    (folder / 'c.txt').write_text('ΓΕΜΗ 333333\n')
+
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint'))
+    dead_letter = DeadLetterQueue(str(tmp_path / 'dead_letter.jsonl'))
+    fp = FileProcessor(folder=str(folder), checkpoint=checkpoint,
+                       dead_letter=dead_letter)
+    files = fp.iter_files()
+    filename, data = next(files)
+    checkpoint.mark(filename)
+    checkpoint.close()
+
+    assert filename == 'a.txt'
+    assert data['gemh'] == 111111
+
+    # Resume after an interruption
+    fp = FileProcessor(folder=str(folder), checkpoint=checkpoint,
+                       dead_letter=dead_letter)
+    results = fp.process_files()
+    checkpoint.close()
+
+    assert [data['gemh'] for data in results] == [333333]
+    assert fp.skipped == 1
+    assert dead_letter.count == 1
+    with open(dead_letter.path) as f:
+        entry = json.loads(f.readline())
+    assert entry['file'] == 'b.txt'
+    assert 'ValueError' in entry['traceback']
+    assert checkpoint.load() == {'a.txt', 'b.txt', 'c.txt'}
+
+
+@pytest.mark.parametrize('extension', ['zip', 'tar.gz'])
+def test_file_processor_archive(tmp_path, extension: str) -> None:
+    documents = {'txt/a.txt': 'ΓΕΜΗ 111111\n',
+                 'txt/b.txt': 'ΓΕΜΗ 222222\n',
+                 'txt/readme.md': 'ΓΕΜΗ 333333\n'}
+    path = str(tmp_path / f'archive.{extension}')
+    if extension == 'zip':
+        with zipfile.ZipFile(path, 'w') as archive:
+            for name, text in documents.items():
+                archive.writestr(name, text)
+    else:
+        with tarfile.open(path, 'w:gz') as archive:
+            for name, text in documents.items():
+                data = text.encode('utf-8')
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                archive.addfile(info, BytesIO(data))
+
+    checkpoint = Checkpoint(str(tmp_path / 'checkpoint'))
+    checkpoint.mark('txt/a.txt')
+    checkpoint.close()
+    fp = FileProcessor(folder=path, checkpoint=checkpoint)
+
+    assert fp.is_archive
+    assert fp.list_files() == ['txt/a.txt', 'txt/b.txt']
+    assert [data['gemh'] for data in fp.process_files()] == [222222]
+    assert fp.skipped == 1
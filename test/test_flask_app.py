@@ -1,14 +1,29 @@
+import brotli
+import gzip
+import json
+import msgpack
+import pickle
 import pytest
+import tarfile
+import threading
+import time
 from datetime import datetime
+from io import BytesIO
 from flask import Flask, url_for
 from typing import Generator
 
 from api.app import create_app, redis_client
 from api.models import Company
 from api.schemas import CompanySchema
+from api.snapshot import SnapshotStore, read_changes
+from config import config
 
 COMPANY_ROUTE: str = 'company.get_company'
 COMPANIES_ROUTE: str = 'company.get_companies'
+COMPANY_GEMH_ROUTE: str = 'company.get_company_by_gemh'
+EXTRACT_ROUTE: str = 'company.extract_companies'
+JOB_ROUTE: str = 'jobs.get_job_status'
+JOB_CREATE_ROUTE: str = 'jobs.create_folder_job'
 
 
 @pytest.fixture
@@ -16,10 +31,10 @@ def app() -> Generator[Flask, None, None]:
     """Create and configure a new app instance for each test.
     """
     app = create_app('testing')
-    redis_client.flushall()
     with app.app_context():
+        redis_client.flushdb()
         yield app
-        redis_client.flushall()
+        redis_client.flushdb()
 
 
 @pytest.fixture
@@ -49,11 +64,11 @@ def companies(db) -> list:
     companies = [
         Company(name='Company A',
                 website='www.company-a.com',
-                gemh='111111111',
+                gemh=111111111,
                 registration_date=datetime(2001, 1, 1)),
         Company(name='Company B',
                 website='www.company-b.com',
-                gemh='222222222',
+                gemh=222222222,
                 registration_date=datetime(2002, 2, 2))]
 
     db.session.add_all(companies)
@@ -155,3 +170,539 @@ def test_get_companies_pagination(client, companies: list) -> None:
 
     data = response.get_json()['data']
     assert len(data) == 0
+
+
+def test_folder_job(client, db, tmp_path) -> None:
+    """Test that a queued folder job is processed by a worker and reports
+    its progress.
+    """
+    from api.ingest import work
+
+    (tmp_path / 'a.txt').write_text('ΓΕΜΗ 123456\n'
+                                    'την 01/01/2022 καταχωρηθηκε\n'
+                                    'ΕΠΩΝΥΜΙΑ TEST COMPANY\n')
+    client.application.config['INGEST_ROOT'] = str(tmp_path)
+
+    response = client.post(url_for(JOB_CREATE_ROUTE), json={'folder': '.'})
+    assert response.status_code == 202
+    job_id = response.get_json()['id']
+    assert response.get_json()['status'] == 'queued'
+
+    assert work(burst=True, timeout=1) == 1
+
+    response = client.get(url_for(JOB_ROUTE, id=job_id))
+    assert response.status_code == 200
+
+    data = response.get_json()
+    assert data['status'] == 'finished'
+    assert data['processed'] == data['total'] == 1
+    assert data['added'] == 1
+    assert Company.query.filter_by(name='TEST COMPANY').count() == 1
+
+
+def test_recover_orphaned_jobs(client, db, tmp_path) -> None:
+    """Test that the jobs of a worker that stopped are queued again if they
+    were not started and marked as failed if they were running.
+    """
+    from api.ingest import JOB_KEY, JOB_PROCESSING_QUEUE, enqueue_job, \
+        get_job, recover_jobs, work
+
+    config = client.application.config
+    queue = config['INGEST_QUEUE']
+    processing = JOB_PROCESSING_QUEUE.format(queue)
+    queued = enqueue_job(folder=str(tmp_path))
+    running = enqueue_job(folder=str(tmp_path))
+    for _ in range(2):
+        redis_client.brpoplpush(queue, processing, timeout=1)
+
+    # Jobs are fresh when they are moved to the processing list
+    assert recover_jobs() == 0
+
+    # Jobs with a recent heartbeat belong to a live worker
+    redis_client.hset(JOB_KEY.format(queued), 'heartbeat', 0)
+    redis_client.hset(JOB_KEY.format(running), mapping={
+        'status': 'running', 'heartbeat': time.time()})
+    assert recover_jobs() == 1
+    assert redis_client.lrange(queue, 0, -1) == [queued.encode()]
+
+    config['INGEST_JOB_TIMEOUT'] = 0
+    assert recover_jobs() == 1
+    assert redis_client.lrange(processing, 0, -1) == []
+    assert get_job(running)['status'] == 'failed'
+    assert get_job(queued)['status'] == 'queued'
+
+    # A worker claimed the job before it was queued again, so the requeued
+    # copy is not run twice
+    redis_client.hset(JOB_KEY.format(queued), 'claimed', time.time())
+    assert work(burst=True, timeout=1) == 0
+    assert get_job(queued)['status'] == 'queued'
+    assert redis_client.lrange(processing, 0, -1) == []
+
+
+def test_archive_job(client, db, tmp_path) -> None:
+    """Test that a tar archive job is processed in one pass and reports its
+    total once it is finished.
+    """
+    from api.ingest import enqueue_job, get_job, work
+
+    text = ('ΓΕΜΗ 123456\nτην 01/01/2022 καταχωρηθηκε\n'
+            'ΕΠΩΝΥΜΙΑ TEST COMPANY\n').encode()
+    path = tmp_path / 'documents.tar.gz'
+    with tarfile.open(path, 'w:gz') as archive:
+        info = tarfile.TarInfo('a.txt')
+        info.size = len(text)
+        archive.addfile(info, BytesIO(text))
+
+    job_id = enqueue_job(folder=str(path))
+    assert work(burst=True, timeout=1) == 1
+
+    job = get_job(job_id)
+    assert job['status'] == 'finished'
+    assert job['processed'] == job['total'] == 1
+    assert job['added'] == 1
+
+
+def test_folder_job_outside_ingest_root(client) -> None:
+    """Test that folders outside of the ingest root are rejected.
+    """
+    response = client.post(url_for(JOB_CREATE_ROUTE),
+                           json={'folder': '../../'})
+    assert response.status_code == 400
+
+
+def test_get_job_not_found(client) -> None:
+    """Test that the GET /jobs/<id> endpoint returns 404 when the job does
+    not exist.
+    """
+    response = client.get(url_for(JOB_ROUTE, id='missing'))
+    assert response.status_code == 404
+
+
+def test_extract_stops_on_database_error(app, db, tmp_path,
+                                        monkeypatch) -> None:
+    """Test that flask extract stops without dead-lettering or recording
+    the batch when the database fails, so --resume retries it.
+    """
+    from sqlalchemy.exc import OperationalError
+    from data_extractor import Checkpoint
+
+    folder = tmp_path / 'txt'
+    folder.mkdir()
+    for index in range(3):
+        (folder / f'{index}.txt').write_text(f'ΓΕΜΗ 12345{index}\n')
+
+    def lost_connection(*args) -> None:
+        raise OperationalError('INSERT', {}, Exception('Server has gone away'))
+    monkeypatch.setattr('api.cli.save_companies', lost_connection)
+    monkeypatch.setattr('api.cli.save_company', lost_connection)
+
+    args = ['extract', '--folder', str(folder), '--batch-size', '2',
+            '--checkpoint', str(tmp_path / 'checkpoint'),
+            '--dead-letter', str(tmp_path / 'dead_letter.jsonl')]
+    result = app.test_cli_runner().invoke(args=args)
+    assert result.exit_code == 1
+    assert 'Database error' in result.output
+    assert not (tmp_path / 'dead_letter.jsonl').exists()
+    assert Checkpoint(str(tmp_path / 'checkpoint')).load() == set()
+
+    monkeypatch.undo()
+    result = app.test_cli_runner().invoke(args=[*args, '--resume'])
+    assert result.exit_code == 0
+    assert Company.query.count() == 3
+
+
+def test_job_fails_on_database_error(client, db, tmp_path,
+                                    monkeypatch) -> None:
+    """Test that a job fails without dead-lettering its documents when the
+    database fails.
+    """
+    from sqlalchemy.exc import OperationalError
+    from api.ingest import enqueue_job, get_job, run_job
+
+    (tmp_path / 'a.txt').write_text('ΓΕΜΗ 123456\n')
+
+    def lost_connection(data) -> None:
+        raise OperationalError('INSERT', {}, Exception('Server has gone away'))
+    monkeypatch.setattr('api.ingest.save_company', lost_connection)
+
+    job_id = enqueue_job(folder=str(tmp_path))
+    run_job(job_id)
+    job = get_job(job_id)
+    assert job['status'] == 'failed'
+    assert job['failed'] == 0
+    assert job['errors'] == []
+
+
+def test_extract_companies_ndjson(client, db) -> None:
+    """Test that the POST /company/extract endpoint extracts NDJSON
+    documents without storing them.
+    """
+    documents = [{'name': 'a', 'text': 'ΓΕΜΗ 123456 ΕΠΩΝΥΜΙΑ TEST COMPANY'},
+                 'την 01/01/2022 καταχωρηθηκε']
+    response = client.post(
+        url_for(EXTRACT_ROUTE),
+        data='\n'.join(json.dumps(d) for d in documents),
+        content_type='application/x-ndjson')
+    assert response.status_code == 200
+
+    data = response.get_json()
+    assert [d['document'] for d in data] == ['a', '2']
+    assert data[0]['gemh'] == 123456
+    assert data[0]['name'] == 'TEST COMPANY'
+    assert data[0]['confidence']['gemh'] == 1.0
+    assert data[1]['registration_date'].startswith('2022-01-01')
+    assert Company.query.count() == 0
+
+
+def test_extract_companies_upload_and_save(client, db) -> None:
+    """Test that the POST /company/extract endpoint stores uploaded
+    documents and updates existing companies.
+    """
+    text = 'ΓΕΜΗ 123456 ΕΠΩΝΥΜΙΑ TEST COMPANY ιστοσελιδασ www.example.com'
+    for _ in range(2):
+        response = client.post(
+            url_for(EXTRACT_ROUTE, save=True),
+            data={'documents': [(BytesIO(text.encode()), 'a.txt')]},
+            content_type='multipart/form-data')
+        assert response.status_code == 200
+
+    data = response.get_json()
+    assert data[0]['document'] == 'a.txt'
+    assert Company.query.count() == 1
+    assert db.session.get(Company, data[0]['id']).website == 'www.example.com'
+
+
+def test_extract_companies_too_many_documents(client, db) -> None:
+    """Test that the POST /company/extract endpoint stores nothing when the
+    body has too many documents.
+    """
+    client.application.config['EXTRACT_MAX_DOCUMENTS'] = 1
+    documents = ['ΓΕΜΗ 123456 ΕΠΩΝΥΜΙΑ TEST COMPANY',
+                 'ΓΕΜΗ 654321 ΕΠΩΝΥΜΙΑ OTHER COMPANY']
+    response = client.post(
+        url_for(EXTRACT_ROUTE, save=True),
+        data='\n'.join(json.dumps(d) for d in documents),
+        content_type='application/x-ndjson')
+    assert response.status_code == 413
+    assert Company.query.count() == 0
+
+
+def test_extract_companies_unsupported_media_type(client) -> None:
+    """Test that the POST /company/extract endpoint rejects other bodies.
+    """
+    response = client.post(url_for(EXTRACT_ROUTE), json={'text': ''})
+    assert response.status_code == 415
+
+
+def test_metrics(client, companies: list) -> None:
+    """Test that the /metrics endpoint reports requests, queries and cache
+    lookups.
+    """
+    client.get(url_for(COMPANIES_ROUTE))
+    client.get(url_for(COMPANIES_ROUTE))
+
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+
+    text = response.get_data(as_text=True)
+    assert ('http_requests_total{endpoint="company.get_companies",'
+            'method="GET",status="200"}') in text
+    assert 'http_request_duration_seconds_bucket{' in text
+    assert 'db_queries_total' in text
+    assert 'cache_requests_total{result="hit"}' in text
+    assert 'cache_hit_ratio' in text
+
+
+def test_get_company_by_gemh(client, companies: list) -> None:
+    """Test that the GET /company/gemh/<gemh> endpoint returns a company.
+    """
+    response = client.get(url_for(COMPANY_GEMH_ROUTE, gemh=222222222))
+    assert response.status_code == 200
+    assert response.get_json() == CompanySchema().dump(companies[1])
+
+    response = client.get(url_for(COMPANY_GEMH_ROUTE, gemh=333333333))
+    assert response.status_code == 404
+
+
+def test_get_companies_normalized_filters(client, companies: list) -> None:
+    """Test that the GET /companies endpoint matches websites and names
+    regardless of their formatting.
+    """
+    response = client.get(url_for(COMPANIES_ROUTE,
+                                  website='HTTPS://www.Company-A.com/'))
+    assert response.status_code == 200
+    assert [c['name'] for c in response.get_json()['data']] == ['Company A']
+
+    response = client.get(url_for(COMPANIES_ROUTE, name='company  b'))
+    assert [c['name'] for c in response.get_json()['data']] == ['Company B']
+
+    response = client.get(url_for(COMPANIES_ROUTE, gemh=111111111))
+    assert response.get_json()['pagination']['total'] == 1
+
+
+@pytest.fixture
+def replica_app(tmp_path, monkeypatch) -> Generator[Flask, None, None]:
+    """Create an app whose reads go to two replica databases with their own
+    data, the second one lagging behind the first.
+    """
+    replicas = {
+        'replica_0': [{'id': 1, 'name': 'Replica Company'},
+                      {'id': 2, 'name': 'Replica Company B'},
+                      {'id': 3, 'name': 'Replica Company C'}],
+        'replica_1': [{'id': 1, 'name': 'Replica Company'}]}
+    testing = config['testing']
+    monkeypatch.setattr(testing, 'SQLALCHEMY_BINDS', {
+        key: f'sqlite:///{tmp_path / f"{key}.sqlite3"}' for key in replicas})
+    monkeypatch.setattr(testing, 'REPLICA_BINDS', list(replicas))
+
+    app = create_app('testing')
+    with app.app_context():
+        db = app.extensions['sqlalchemy'].db
+        db.drop_all()
+        db.create_all()
+        for key, rows in replicas.items():
+            replica = db.engines[key]
+            Company.__table__.create(replica)
+            with replica.begin() as connection:
+                connection.execute(Company.__table__.insert(), rows)
+        app.extensions['replica_router'].refresh()
+        yield app
+        db.session.remove()
+        # Forget the replica binds for the apps of the next tests
+        for key in replicas:
+            db.metadatas.pop(key, None)
+
+
+def test_reads_are_routed_to_replica(replica_app) -> None:
+    """Test that GET requests read from the replica and writes go to the
+    primary.
+    """
+    client = replica_app.test_client()
+    db = replica_app.extensions['sqlalchemy'].db
+
+    response = client.get(url_for(COMPANY_ROUTE, id=1))
+    assert response.status_code == 200
+    assert response.get_json()['name'] == 'Replica Company'
+
+    response = client.post(
+        url_for(EXTRACT_ROUTE, save=True),
+        data=json.dumps({'text': 'ΓΕΜΗ 123456 ΕΠΩΝΥΜΙΑ TEST COMPANY'}),
+        content_type='application/x-ndjson')
+    assert response.status_code == 200
+    assert db.session.get(Company, 1).name == 'TEST COMPANY'
+
+
+def test_request_reads_from_one_replica(replica_app) -> None:
+    """Test that all the queries of a request read from the same replica, so
+    the total of a page matches its rows.
+    """
+    replica_app.config['CACHE_ENABLED'] = False
+    client = replica_app.test_client()
+
+    totals = set()
+    for _ in range(4):
+        body = client.get(url_for(COMPANIES_ROUTE)).get_json()
+        assert body['pagination']['total'] == len(body['data'])
+        totals.add(body['pagination']['total'])
+    assert totals == {1, 3}
+
+
+def test_lagging_replica_falls_back_to_primary(replica_app) -> None:
+    """Test that reads use the primary when every replica lags behind.
+    """
+    replica_app.extensions['replica_router'].max_lag = -1
+    client = replica_app.test_client()
+
+    response = client.get(url_for(COMPANY_ROUTE, id=1))
+    assert response.status_code == 404
+
+
+def test_get_company_from_snapshot(client, companies: list,
+                                   tmp_path) -> None:
+    """Test that company lookups are served from the snapshot written by
+    flask snapshot.
+    """
+    path = str(tmp_path / 'companies.snapshot')
+    result = client.application.test_cli_runner().invoke(
+        args=['snapshot', path])
+    assert result.exit_code == 0
+    client.application.extensions['snapshot'] = SnapshotStore(
+        path, check_interval=0, changes=read_changes)
+
+    response = client.get(url_for(COMPANY_ROUTE, id=companies[0].id))
+    assert response.status_code == 200
+    assert response.get_json()['name'] == 'Company A'
+
+    # Changes outside the API are not visible
+    db = client.application.extensions['sqlalchemy'].db
+    companies[1].website = 'www.renamed-b.com'
+    db.session.commit()
+
+    response = client.get(url_for(COMPANY_ROUTE, id=companies[1].id))
+    assert response.get_json()['website'] == 'www.company-b.com'
+
+    # Companies updated by extractions are read from the database
+    response = client.post(
+        url_for(EXTRACT_ROUTE, save=True),
+        data=json.dumps({'text': 'ΓΕΜΗ 111111111 ΕΠΩΝΥΜΙΑ RENAMED'}),
+        content_type='application/x-ndjson')
+    assert response.status_code == 200
+
+    response = client.get(url_for(COMPANY_ROUTE, id=companies[0].id))
+    assert response.get_json()['name'] == 'RENAMED'
+    response = client.get(url_for(COMPANY_GEMH_ROUTE, gemh=111111111))
+    assert response.get_json()['name'] == 'RENAMED'
+
+    response = client.get(url_for(COMPANY_GEMH_ROUTE, gemh=222222222))
+    assert response.get_json()['website'] == 'www.company-b.com'
+
+    response = client.get(url_for(COMPANY_ROUTE, id=999))
+    assert response.status_code == 404
+
+    # Companies added after the snapshot are read from the database
+    company = Company(name='Company C', gemh=333333333)
+    db.session.add(company)
+    db.session.commit()
+
+    response = client.get(url_for(COMPANY_ROUTE, id=company.id))
+    assert response.get_json()['name'] == 'Company C'
+    response = client.get(url_for(COMPANY_GEMH_ROUTE, gemh=333333333))
+    assert response.get_json()['name'] == 'Company C'
+
+
+def test_cache_serves_stale_entry_while_refreshing(app) -> None:
+    """Test that a stale entry is served without loading while another
+    request holds the refresh lock.
+    """
+    from api.pagination import cached
+
+    redis_client.set('key', pickle.dumps(
+        {'value': 'stale', 'refresh_at': time.time() - 1, 'delta': 0}))
+    redis_client.set('key:lock', 'other request')
+
+    assert cached('key', lambda: pytest.fail('Loaded twice')) == 'stale'
+
+
+def test_cache_refreshes_stale_entry(app) -> None:
+    """Test that a stale entry is refreshed by the request taking the
+    lock, and that the lock is released.
+    """
+    from api.pagination import cached
+
+    redis_client.set('key', pickle.dumps(
+        {'value': 'stale', 'refresh_at': time.time() - 1, 'delta': 0}))
+
+    assert cached('key', lambda: 'fresh') == 'fresh'
+    assert cached('key', lambda: pytest.fail('Loaded twice')) == 'fresh'
+    assert redis_client.get('key:lock') is None
+
+
+def test_cache_waits_for_concurrent_load(app) -> None:
+    """Test that a miss waits for the request holding the lock instead of
+    loading the value again.
+    """
+    from api.pagination import cached
+
+    redis_client.set('key:lock', 'other request')
+    timer = threading.Timer(0.1, redis_client.set, args=('key', pickle.dumps(
+        {'value': 'loaded', 'refresh_at': time.time() + 60, 'delta': 0})))
+    timer.start()
+
+    assert cached('key', lambda: pytest.fail('Loaded twice')) == 'loaded'
+    timer.join()
+
+
+def test_cache_takes_over_released_lock(app) -> None:
+    """Test that a waiting miss loads the value once the request holding
+    the lock releases it without storing one.
+    """
+    from api.pagination import cached
+
+    redis_client.set('key:lock', 'other request')
+    timer = threading.Timer(0.1, redis_client.delete, args=('key:lock',))
+    timer.start()
+
+    assert cached('key', lambda: 'loaded') == 'loaded'
+    timer.join()
+    assert redis_client.get('key:lock') is None
+
+
+def test_cache_wait_times_out(app) -> None:
+    """Test that a miss fails instead of loading without the lock when the
+    value is not loaded before the lock expires.
+    """
+    from werkzeug.exceptions import ServiceUnavailable
+    from api.pagination import cached
+
+    app.config['CACHE_LOCK_TIMEOUT'] = 0.1
+    redis_client.set('key:lock', 'other request')
+
+    with pytest.raises(ServiceUnavailable):
+        cached('key', lambda: pytest.fail('Loaded without the lock'))
+
+
+def test_cache_disabled(app) -> None:
+    """Test that every call loads the value when the cache is disabled.
+    """
+    from api.pagination import cached
+
+    app.config['CACHE_ENABLED'] = False
+    assert cached('key', lambda: 'first') == 'first'
+    assert cached('key', lambda: 'second') == 'second'
+    assert redis_client.get('key') is None
+
+
+def test_compressed_response(app, client, companies: list) -> None:
+    """Test that responses above COMPRESS_MIN_SIZE are compressed with the
+    encoding the client prefers.
+    """
+    response = client.get(url_for(COMPANIES_ROUTE),
+                          headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in response.headers
+    assert 'Accept-Encoding' in response.headers['Vary']
+
+    app.config['COMPRESS_MIN_SIZE'] = 0
+    response = client.get(url_for(COMPANY_ROUTE, id=companies[0].id),
+                          headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(response.data)) == \
+        CompanySchema().dump(companies[0])
+
+
+def test_msgpack_response(client, companies: list) -> None:
+    """Test that msgpack is returned when the client prefers it.
+    """
+    response = client.get(url_for(COMPANY_ROUTE, id=companies[0].id),
+                          headers={'Accept': 'application/msgpack'})
+    assert response.mimetype == 'application/msgpack'
+    assert 'Accept' in response.headers['Vary']
+    assert msgpack.unpackb(response.data) == \
+        CompanySchema().dump(companies[0])
+
+
+def test_encoded_response_is_cached(app, client, companies: list,
+                                    monkeypatch) -> None:
+    """Test that repeated hits are served from the cached encoded bytes
+    for each representation, without loading or compressing again.
+    """
+    app.config['COMPRESS_MIN_SIZE'] = 0
+    headers = {'Accept-Encoding': 'br, gzip'}
+    first = client.get(url_for(COMPANIES_ROUTE), headers=headers)
+    assert first.headers['Content-Encoding'] == 'br'
+
+    monkeypatch.setattr('api.pagination.cached',
+                        lambda key, load: pytest.fail('Not served cached'))
+    monkeypatch.setattr('api.encoding.compress',
+                        lambda body, encoding: pytest.fail('Compressed'))
+    second = client.get(url_for(COMPANIES_ROUTE), headers=headers)
+    assert second.headers['Content-Encoding'] == 'br'
+    assert second.headers['Vary'] == first.headers['Vary']
+    assert second.data == first.data
+
+    # Other representations are encoded from the same cache entry
+    monkeypatch.undo()
+    response = client.get(url_for(COMPANIES_ROUTE),
+                          headers={'Accept': 'application/msgpack'})
+    assert msgpack.unpackb(response.data) == \
+        json.loads(brotli.decompress(first.data))
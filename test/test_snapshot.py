@@ -0,0 +1,79 @@
+import os
+import pytest
+from datetime import datetime
+
+from api.snapshot import Snapshot, SnapshotStore, write_snapshot
+
+
+def test_snapshot_lookups(tmp_path) -> None:
+    path = str(tmp_path / 'companies.snapshot')
+    records = [{'id': id, 'name': f'ΕΤΑΙΡΕΙΑ {id}', 'gemh': 1000 - id,
+                'website': None, 'registration_date': datetime(2020, 1, id)}
+               for id in (3, 1, 2)]
+    records.append({'id': 4, 'name': 'NO GEMH', 'gemh': None,
+                    'website': None, 'registration_date': None})
+
+    assert write_snapshot(path, records) == 4
+    snapshot = Snapshot(path)
+
+    assert snapshot.count == 4
+    assert snapshot.gemh_count == 3
+    assert snapshot.get_by_id(2)['name'] == 'ΕΤΑΙΡΕΙΑ 2'
+    assert snapshot.get_by_id(2)['registration_date'] == datetime(2020, 1, 2)
+    assert snapshot.get_by_id(4)['gemh'] is None
+    assert snapshot.get_by_gemh(997)['id'] == 3
+    assert snapshot.get_by_id(5) is None
+    assert snapshot.get_by_gemh(1) is None
+
+
+def test_snapshot_store_swaps_to_new_snapshot(tmp_path) -> None:
+    path = str(tmp_path / 'companies.snapshot')
+    store = SnapshotStore(path, check_interval=0)
+
+    assert store.get() is None
+
+    write_snapshot(path, [{'id': 1, 'name': 'OLD', 'gemh': 1}])
+    old = store.get()
+    assert old.get_by_id(1)['name'] == 'OLD'
+
+    write_snapshot(path, [{'id': 1, 'name': 'NEW', 'gemh': 1}])
+    assert store.get().get_by_id(1)['name'] == 'NEW'
+    assert old.get_by_id(1)['name'] == 'OLD'
+    assert [name for name in os.listdir(tmp_path)] == ['companies.snapshot']
+
+
+def test_snapshot_store_keeps_previous_snapshot(tmp_path) -> None:
+    path = str(tmp_path / 'companies.snapshot')
+    store = SnapshotStore(path, check_interval=0)
+    write_snapshot(path, [{'id': 1, 'name': 'OLD', 'gemh': 1}])
+    assert store.get().get_by_id(1)['name'] == 'OLD'
+
+    # A truncated copy of a newer snapshot
+    write_snapshot(path, [{'id': 1, 'name': 'NEW', 'gemh': 1}])
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path + '.tmp', 'wb') as f:
+        f.write(data[:-4])
+    os.replace(path + '.tmp', path)
+
+    assert store.get().get_by_id(1)['name'] == 'OLD'
+    with pytest.raises(ValueError):
+        Snapshot(path)
+
+
+def test_snapshot_store_skips_changed_companies(tmp_path) -> None:
+    path = str(tmp_path / 'companies.snapshot')
+    write_snapshot(path, [{'id': 1, 'name': 'A', 'gemh': 11},
+                          {'id': 2, 'name': 'B', 'gemh': 22}])
+    created = Snapshot(path).created
+    changes = {f'id:1:{created}'.encode(): str(created).encode(),
+               f'gemh:22:{created}'.encode(): str(created).encode(),
+               b'id:2:0': b'0'}
+    store = SnapshotStore(path, check_interval=0, changes=lambda: changes)
+
+    snapshot = store.get()
+    assert snapshot.get_by_id(1) is None
+    assert snapshot.get_by_gemh(11)['name'] == 'A'
+    assert snapshot.get_by_gemh(22) is None
+    # Changes from before the snapshot are in it already
+    assert snapshot.get_by_id(2)['name'] == 'B'
@@ -0,0 +1,54 @@
+import time
+from sqlalchemy import create_engine, text
+
+from api.storage import MemoryCache, configure_engine
+
+
+def test_memory_cache_expiry_and_nx() -> None:
+    cache = MemoryCache()
+
+    assert cache.set('key', 'value', px=50, nx=True)
+    assert cache.set('key', 'other', nx=True) is None
+    assert cache.get('key') == b'value'
+
+    time.sleep(0.06)
+    assert cache.get('key') is None
+
+
+def test_memory_cache_hash_and_queue() -> None:
+    cache = MemoryCache()
+
+    pipe = cache.pipeline()
+    pipe.hset('job', mapping={'status': 'queued', 'processed': 0})
+    pipe.hincrby('job', 'processed', 2)
+    pipe.lpush('queue', 'a', 'b')
+    pipe.execute()
+
+    assert cache.hgetall('job') == {b'status': b'queued', b'processed': b'2'}
+    assert cache.hmget('job', 'status', 'missing') == [b'queued', None]
+    assert cache.brpop('queue', timeout=1) == (b'queue', b'a')
+    assert cache.brpop('queue', timeout=1) == (b'queue', b'b')
+    assert cache.brpop('queue', timeout=0.01) is None
+
+
+def test_memory_cache_processing_list() -> None:
+    cache = MemoryCache()
+    cache.lpush('queue', 'a', 'b')
+
+    assert cache.brpoplpush('queue', 'processing', timeout=1) == b'a'
+    assert cache.brpoplpush('queue', 'processing', timeout=1) == b'b'
+    assert cache.brpoplpush('queue', 'processing', timeout=0.01) is None
+    assert cache.lrange('processing', 0, -1) == [b'b', b'a']
+    assert cache.lrem('processing', 1, 'a') == 1
+    assert cache.lrem('processing', 1, 'a') == 0
+    assert cache.lrange('processing', 0, -1) == [b'b']
+
+
+def test_configure_sqlite_engine(tmp_path) -> None:
+    engine = create_engine(f'sqlite:///{tmp_path / "test.sqlite3"}')
+    configure_engine(engine, read_only=True)
+
+    with engine.connect() as connection:
+        assert connection.execute(
+            text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert connection.execute(text('PRAGMA query_only')).scalar() == 1